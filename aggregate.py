@@ -0,0 +1,133 @@
+"""Mergeable summaries of sentiment values."""
+
+import json
+from math import sqrt
+
+class SentimentAggregate(object):
+    """The count, sum, sum of squares, minimum and maximum of a collection of
+    sentiment values, which can be updated one value at a time, merged with
+    the aggregate of another collection, and serialized.
+
+    >>> a = SentimentAggregate()
+    >>> for value in [0.5, -0.25, 0.25]:
+    ...     a.add(value)
+    >>> a.count, a.mean(), a.minimum, a.maximum
+    (3, 0.16666666666666666, -0.25, 0.5)
+    >>> b = SentimentAggregate.from_list([1, 0.75, 0.5625, 0.75, 0.75])
+    >>> a.merge(b).count, a.mean(), a.maximum
+    (4, 0.3125, 0.75)
+    >>> round(a.variance(), 5)
+    0.18229
+    >>> SentimentAggregate.from_list(a.to_list()) == a
+    True
+    """
+
+    __slots__ = ('count', 'total', 'total_squares', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.total_squares = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        """Include one sentiment value."""
+        self.count += 1
+        self.total += value
+        self.total_squares += value * value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        """Include every value summarized by other, and return self."""
+        if other.count:
+            self.count += other.count
+            self.total += other.total
+            self.total_squares += other.total_squares
+            if self.minimum is None or other.minimum < self.minimum:
+                self.minimum = other.minimum
+            if self.maximum is None or other.maximum > self.maximum:
+                self.maximum = other.maximum
+        return self
+
+    def mean(self):
+        """Return the average value, or None if there are no values."""
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def variance(self):
+        """Return the sample variance, or None for fewer than two values."""
+        if self.count < 2:
+            return None
+        square_of_total = self.total * self.total / self.count
+        return max(self.total_squares - square_of_total, 0) / (self.count - 1)
+
+    def confidence_interval(self, z=1.96):
+        """Return the (low, high) normal confidence interval of the mean, or
+        None for fewer than two values.  The default z is for 95%.
+        """
+        if self.count < 2:
+            return None
+        margin = z * sqrt(self.variance() / self.count)
+        return (self.mean() - margin, self.mean() + margin)
+
+    def to_list(self):
+        """Return the fields of this aggregate as a list."""
+        return [self.count, self.total, self.total_squares, self.minimum,
+                self.maximum]
+
+    @classmethod
+    def from_list(cls, fields):
+        """Return the aggregate whose to_list is fields."""
+        aggregate = cls()
+        (aggregate.count, aggregate.total, aggregate.total_squares,
+         aggregate.minimum, aggregate.maximum) = fields
+        return aggregate
+
+    def __eq__(self, other):
+        return (isinstance(other, SentimentAggregate)
+                and self.to_list() == other.to_list())
+
+    def __repr__(self):
+        return 'SentimentAggregate.from_list({0!r})'.format(self.to_list())
+
+
+def merge_aggregates(mappings):
+    """Merge dictionaries from keys to aggregates into a new dictionary.
+
+    >>> one = {'CA': SentimentAggregate.from_list([1, 0.5, 0.25, 0.5, 0.5])}
+    >>> two = {'CA': SentimentAggregate.from_list([1, -0.5, 0.25, -0.5, -0.5])}
+    >>> merge_aggregates([one, two])['CA'].mean()
+    0.0
+    """
+    merged = {}
+    for mapping in mappings:
+        for key, aggregate in mapping.items():
+            merged.setdefault(key, SentimentAggregate()).merge(aggregate)
+    return merged
+
+def dumps_aggregates(aggregates):
+    """Serialize a dictionary from keys to aggregates as a JSON string.
+
+    Keys may be strings, numbers, or tuples of them (such as (state, hour)).
+
+    >>> aggregates = {('CA', 13): SentimentAggregate.from_list([1, 0.5, 0.25,
+    ...                                                         0.5, 0.5])}
+    >>> loads_aggregates(dumps_aggregates(aggregates)) == aggregates
+    True
+    """
+    return json.dumps([[key, aggregate.to_list()]
+                       for key, aggregate in aggregates.items()])
+
+def loads_aggregates(text):
+    """Return the dictionary serialized by dumps_aggregates."""
+    aggregates = {}
+    for key, fields in json.loads(text):
+        if type(key) == list:
+            key = tuple(key)
+        aggregates[key] = SentimentAggregate.from_list(fields)
+    return aggregates
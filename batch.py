@@ -0,0 +1,251 @@
+"""Column-oriented storage for large collections of tweets."""
+
+from array import array
+from datetime import datetime, timedelta
+import sys
+
+EPOCH = datetime(1970, 1, 1)
+NO_TIME = -2 ** 63  # Stored in place of a missing (None) time
+NO_SENTIMENT = float('nan')  # Stored in place of a missing (None) sentiment
+
+def to_epoch(time):
+    """Return the number of seconds between EPOCH and a naive datetime.
+
+    >>> to_epoch(datetime(2011, 8, 28, 19, 3, 1))
+    1314558181
+    >>> to_epoch(None) == NO_TIME
+    True
+    """
+    if time is None:
+        return NO_TIME
+    return (time - EPOCH) // timedelta(seconds=1)
+
+def from_epoch(seconds):
+    """Return the naive datetime that is seconds after EPOCH.
+
+    >>> from_epoch(1314558181)
+    datetime.datetime(2011, 8, 28, 19, 3, 1)
+    """
+    if seconds == NO_TIME:
+        return None
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class TweetBatch(object):
+    """A compact sequence of tweets stored as parallel columns.
+
+    Latitudes and longitudes are float64 arrays, times are int64 seconds since
+    EPOCH, and the texts of all tweets share one UTF-8 buffer indexed by an
+    array of offsets.  Indexing or iterating over a batch returns TweetRow
+    views, which support the same keys as the tweets made by trends.make_tweet.
+
+    >>> b = TweetBatch()
+    >>> b.append('just ate lunch', datetime(2012, 9, 24, 13), 38, -122)
+    >>> b.append('go bears', None, 37.87, -122.26)
+    >>> len(b)
+    2
+    >>> b[0]['text'], b[0]['time']
+    ('just ate lunch', datetime.datetime(2012, 9, 24, 13, 0))
+    >>> [row['latitude'] for row in b]
+    [38.0, 37.87]
+    >>> b.subset([1])[0]['text']
+    'go bears'
+
+    A batch may also hold the enrichment columns that enrichment.py computes
+    once per tweet: sentiments (a float64 array, NaN for no sentiment),
+    sentiment_counts (an int32 array of the number of sentiment words) and
+    states (a list of state names).  They are None until then, and adding a
+    tweet without them removes them.
+
+    >>> b.set_enrichment([0.5, None], [2, 0], ['CA', 'CA'])
+    >>> b[0]['sentiment'], b[1]['sentiment'], 'state' in b[1]
+    (0.5, None, True)
+    >>> b.append('cal', None, 37.87, -122.26)
+    >>> 'state' in b[0], b.states
+    (False, None)
+    """
+
+    # Enrichment columns; None until set_enrichment is called
+    sentiments = sentiment_counts = states = None
+
+    def __init__(self):
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.times = array('q')
+        self.offsets = array('q', [0])
+        self.text_buffer = bytearray()
+
+    @classmethod
+    def from_tweets(cls, tweets):
+        """Return a batch containing each tweet in an iterable of tweets."""
+        batch = cls()
+        for tweet in tweets:
+            batch.append(tweet['text'], tweet['time'],
+                         tweet['latitude'], tweet['longitude'])
+        return batch
+
+    def append(self, text, time, lat, lon):
+        """Add a tweet; arguments are the same as those of make_tweet."""
+        self.clear_enrichment()
+        self.latitudes.append(lat)
+        self.longitudes.append(lon)
+        self.times.append(to_epoch(time))
+        self.text_buffer += text.encode('utf8')
+        self.offsets.append(len(self.text_buffer))
+
+    def append_encoded(self, text, time, lat, lon):
+        """Add a tweet whose text is UTF-8 bytes (or a memoryview of them),
+        lowercasing the text as str.lower does.
+
+        >>> b = TweetBatch()
+        >>> b.append_encoded(memoryview(b'Go BEARS'), None, 38, -122)
+        >>> b.append_encoded('Ärger'.encode('utf8'), None, 38, -122)
+        >>> b.text(0), b.text(1)
+        ('go bears', 'ärger')
+        """
+        text = bytes(text)
+        if text.isascii():
+            text = text.lower()
+        else:
+            text = text.decode('utf8', 'replace').lower().encode('utf8')
+        self.clear_enrichment()
+        self.latitudes.append(lat)
+        self.longitudes.append(lon)
+        self.times.append(to_epoch(time))
+        self.text_buffer += text
+        self.offsets.append(len(self.text_buffer))
+
+    def set_enrichment(self, sentiments, counts, states):
+        """Set the enrichment columns from a sentiment (None for no
+        sentiment), a sentiment word count and a state name for each tweet.
+        """
+        assert len(sentiments) == len(counts) == len(states) == len(self)
+        self.sentiments = array('d', [NO_SENTIMENT if s is None else s
+                                      for s in sentiments])
+        self.sentiment_counts = array('i', counts)
+        self.states = list(states)
+
+    def clear_enrichment(self):
+        self.sentiments = self.sentiment_counts = self.states = None
+
+    def is_enriched(self):
+        """Return whether this batch holds the enrichment columns."""
+        return self.sentiments is not None
+
+    def extend(self, other):
+        """Add every tweet of another batch to the end of this one.  The
+        enrichment columns are kept if both batches have them (or this one is
+        empty).
+        """
+        if other.is_enriched() and (self.is_enriched() or not len(self)):
+            if not self.is_enriched():
+                self.set_enrichment([], [], [])
+            self.sentiments.extend(other.sentiments)
+            self.sentiment_counts.extend(other.sentiment_counts)
+            self.states.extend(other.states)
+        else:
+            self.clear_enrichment()
+        base = len(self.text_buffer)
+        self.latitudes.extend(other.latitudes)
+        self.longitudes.extend(other.longitudes)
+        self.times.extend(other.times)
+        self.text_buffer += other.text_buffer
+        self.offsets.extend(base + end for end in other.offsets[1:])
+
+    def subset(self, indices):
+        """Return a new batch holding the tweets at the given indices."""
+        indices = list(indices)
+        batch = TweetBatch()
+        for i in indices:
+            start, end = self.offsets[i], self.offsets[i + 1]
+            batch.latitudes.append(self.latitudes[i])
+            batch.longitudes.append(self.longitudes[i])
+            batch.times.append(self.times[i])
+            batch.text_buffer += self.text_buffer[start:end]
+            batch.offsets.append(len(batch.text_buffer))
+        if self.is_enriched():
+            batch.sentiments = array('d', (self.sentiments[i] for i in indices))
+            batch.sentiment_counts = array(
+                'i', (self.sentiment_counts[i] for i in indices))
+            batch.states = [self.states[i] for i in indices]
+        return batch
+
+    def text(self, i):
+        """Return the text of the tweet at index i."""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.text_buffer[start:end].decode('utf8')
+
+    def sentiment(self, i):
+        """Return the sentiment of the tweet at index i, or None."""
+        value = self.sentiments[i]
+        return None if value != value else value  # NaN is no sentiment
+
+    def nbytes(self):
+        """Return the number of bytes used by the columns of this batch."""
+        columns = (self.latitudes, self.longitudes, self.times, self.offsets)
+        if self.is_enriched():
+            columns += (self.sentiments, self.sentiment_counts)
+        size = sum(c.itemsize * len(c) for c in columns) + len(self.text_buffer)
+        if self.is_enriched():
+            size += sys.getsizeof(self.states)
+        return size
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('TweetBatch index out of range')
+        return TweetRow(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield TweetRow(self, i)
+
+    def __repr__(self):
+        return '<TweetBatch of {0} tweets>'.format(len(self))
+
+
+class TweetRow(object):
+    """A read-only view of one tweet in a TweetBatch.
+
+    Rows are subscripted with the keys 'text', 'time', 'latitude' and
+    'longitude', so tweet_words, tweet_time and tweet_location accept them.
+    Rows of an enriched batch also have the keys 'sentiment',
+    'sentiment_count' and 'state'.
+    """
+
+    __slots__ = ('batch', 'index')
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == 'text':
+            return self.batch.text(self.index)
+        elif key == 'time':
+            return from_epoch(self.batch.times[self.index])
+        elif key == 'latitude':
+            return self.batch.latitudes[self.index]
+        elif key == 'longitude':
+            return self.batch.longitudes[self.index]
+        elif self.batch.is_enriched():
+            if key == 'sentiment':
+                return self.batch.sentiment(self.index)
+            elif key == 'sentiment_count':
+                return self.batch.sentiment_counts[self.index]
+            elif key == 'state':
+                return self.batch.states[self.index]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in ('text', 'time', 'latitude', 'longitude'):
+            return True
+        return (key in ('sentiment', 'sentiment_count', 'state') and
+                self.batch.is_enriched())
+
+    def __repr__(self):
+        return '<TweetRow {0} of {1!r}>'.format(self.index, self.batch)
@@ -0,0 +1,301 @@
+"""Benchmarks for the trends pipeline.
+
+    python3 benchmark.py tokenizer [file_name] [repeat]
+    python3 benchmark.py pipeline [--sizes N,...] [--seed S] [--output FILE]
+                                  [--baseline FILE] [--threshold T]
+
+The pipeline benchmark times each stage of trends.py separately, on every
+bundled tweet file and on synthetic corpora of the given numbers of lines,
+and writes the throughput and peak memory of each stage to a JSON file.
+Given a baseline (a JSON file from an earlier run), it exits with status 1
+when a stage is slower, or uses more memory, than the baseline by more than
+the threshold fraction.
+"""
+
+from contextlib import contextmanager, redirect_stdout
+import data
+from data import DATA_PATH, parse_tweet_lines
+import io
+import json
+import os
+import platform
+from string import ascii_letters
+from synthetic import BUNDLED_FILES, TweetGenerator
+import sys
+import tempfile
+from time import perf_counter
+import tracemalloc
+from ucb import main
+import tokenizer
+
+def extract_words_reference(text):
+    """The original character-by-character extract_words from trends.py."""
+    sempontuacao = ''
+    for elemento in text:
+        if elemento in ascii_letters:
+            sempontuacao += elemento
+        else:
+            sempontuacao += ' '
+    return sempontuacao.split()
+
+def load_texts(file_name):
+    """Return the lowercase texts of the tweets in a data file."""
+    with open(DATA_PATH + file_name, encoding='utf8') as lines:
+        return [text for text, _, _, _ in parse_tweet_lines(lines)]
+
+def time_tokenizer(tokenize_all, texts, repeat):
+    """Return the best tokens per second of tokenize_all over repeat runs."""
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        words = tokenize_all(texts)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tokens = sum(len(w) for w in words)
+    return tokens / best
+
+def bench_tokenizer(file_name='my_life.txt', repeat=5):
+    """Print tokens per second for each tokenizer on the tweets of file_name."""
+    texts = load_texts(file_name)
+    variants = [
+        ('reference', lambda ts: [extract_words_reference(t) for t in ts]),
+        ('extract_words', lambda ts: [tokenizer.extract_words(t) for t in ts]),
+        ('extract_words_batch', tokenizer.extract_words_batch),
+    ]
+    print('{0} tweets from {1}, best of {2}'.format(len(texts), file_name,
+                                                    repeat))
+    baseline = None
+    for name, tokenize_all in variants:
+        rate = time_tokenizer(tokenize_all, texts, repeat)
+        baseline = baseline or rate
+        print('{0:>20}: {1:12,.0f} tokens/s  {2:5.1f}x'.format(
+            name, rate, rate / baseline))
+
+STAGES = ['load_sentiments', 'load_states', 'generate_filtered_file',
+          'load_tweets', 'extract_words', 'analyze_tweet_sentiment',
+          'group_tweets_by_state', 'average_sentiments', 'group_tweets_by_hour']
+
+CORPUS_NAME = 'corpus.txt'
+
+@contextmanager
+def data_directory(path):
+    """Read and write tweet files in the directory path instead of DATA_PATH,
+    without data.query_cache, within a with statement.
+    """
+    saved = data.DATA_PATH, data.query_cache
+    data.DATA_PATH, data.query_cache = os.path.join(path, ''), None
+    try:
+        yield
+    finally:
+        data.DATA_PATH, data.query_cache = saved
+
+def bundled_corpora():
+    """Return a list of (name, path, term) for the bundled tweet files, each
+    with the term that it was filtered for.
+    """
+    return [(name, DATA_PATH + name, name[:-4].replace('_', ' '))
+            for name in BUNDLED_FILES]
+
+def run_pipeline(term, measure):
+    """Run each stage of the pipeline once, on the file CORPUS_NAME in
+    data.DATA_PATH, calling measure(stage, fn, items) for each stage, which
+    must call fn and return its result.  items is the number of lines or
+    tweets that the stage processes, or None for the length of the result.
+    """
+    import geo
+    import trends
+    corpus = data.DATA_PATH + CORPUS_NAME
+    with open(corpus, 'rb') as f:
+        lines = sum(1 for _ in f)
+    filtered = data.DATA_PATH + data.file_name_for_term(term)
+    if os.path.exists(filtered):
+        os.remove(filtered)
+    measure('load_sentiments', data.load_sentiments, None)
+    measure('load_states', geo.load_states, None)
+    with redirect_stdout(io.StringIO()):
+        measure('generate_filtered_file',
+                lambda: data.generate_filtered_file(CORPUS_NAME, term), lines)
+    tweets = measure('load_tweets', lambda: data.load_tweets(
+        trends.make_tweet, term, CORPUS_NAME), None)
+    n = len(tweets)
+    measure('extract_words',
+            lambda: [trends.extract_words(t['text']) for t in tweets], n)
+    measure('analyze_tweet_sentiment',
+            lambda: [trends.analyze_tweet_sentiment(t) for t in tweets], n)
+    by_state = measure('group_tweets_by_state',
+                       lambda: trends.group_tweets_by_state(tweets), n)
+    measure('average_sentiments',
+            lambda: trends.average_sentiments(by_state), n)
+    measure('group_tweets_by_hour',
+            lambda: trends.group_tweets_by_hour(tweets), n)
+    os.remove(filtered)
+
+def bench_corpus(path, term, repeat=3):
+    """Return a dictionary from stage names to the measurements of that stage
+    on the tweet file at path, filtered for term.
+
+    Each stage is timed with tracemalloc off, keeping the best of repeat
+    runs; a last run under tracemalloc measures the peak memory allocated
+    while the stage runs.
+    """
+    results = {}
+
+    def timed(stage, fn, items):
+        start = perf_counter()
+        value = fn()
+        elapsed = perf_counter() - start
+        if items is None:
+            items = len(value)
+        result = results.setdefault(stage, {'seconds': elapsed})
+        result['seconds'] = min(result['seconds'], elapsed)
+        result['items'] = items
+        result['per_second'] = items / result['seconds']
+        return value
+
+    def traced(stage, fn, items):
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        try:
+            value = fn()
+            results[stage]['peak_bytes'] = \
+                tracemalloc.get_traced_memory()[1] - start
+        finally:
+            tracemalloc.stop()
+        return value
+
+    import trends
+    trends.state_centers()  # Load the sentiments and states from DATA_PATH
+    len(data.word_sentiments)
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = os.path.join(directory, CORPUS_NAME)
+        if os.path.abspath(path) != os.path.abspath(corpus):
+            os.symlink(os.path.abspath(path), corpus)
+        with data_directory(directory):
+            for _ in range(repeat):
+                run_pipeline(term, timed)
+            run_pipeline(term, traced)
+    return results
+
+def find_regressions(results, baseline, threshold=0.25):
+    """Return a list of messages describing each stage in results whose
+    throughput is lower, or whose peak memory is higher, than in baseline by
+    more than the fraction threshold.
+
+    >>> base = {'texas.txt': {'load_tweets': {'per_second': 1000.0,
+    ...                                       'peak_bytes': 100}}}
+    >>> new = {'texas.txt': {'load_tweets': {'per_second': 700.0,
+    ...                                      'peak_bytes': 110}}}
+    >>> find_regressions(new, base)
+    ['texas.txt load_tweets: 700 per second, was 1,000 (-30%)']
+    >>> find_regressions(new, base, threshold=0.5)
+    []
+    """
+    messages = []
+    for corpus, stages in sorted(results.items()):
+        for stage in STAGES:
+            new, old = stages.get(stage), baseline.get(corpus, {}).get(stage)
+            if new is None or old is None:
+                continue
+            if new['per_second'] < old['per_second'] * (1 - threshold):
+                messages.append('{0} {1}: {2:,.0f} per second, was {3:,.0f} '
+                                '({4:+.0%})'.format(
+                                    corpus, stage, new['per_second'],
+                                    old['per_second'],
+                                    new['per_second'] / old['per_second'] - 1))
+            if ('peak_bytes' in new and 'peak_bytes' in old and
+                    new['peak_bytes'] > old['peak_bytes'] * (1 + threshold)):
+                messages.append('{0} {1}: peak {2:,} bytes, was {3:,} '
+                                '({4:+.0%})'.format(
+                                    corpus, stage, new['peak_bytes'],
+                                    old['peak_bytes'],
+                                    new['peak_bytes'] / old['peak_bytes'] - 1))
+    return messages
+
+def print_results(results):
+    """Print a table of the measurements of each corpus and stage."""
+    layout = '{0:>24} {1:>10} {2:>14} {3:>12}'
+    for corpus, stages in results.items():
+        print(corpus)
+        print(layout.format('stage', 'seconds', 'items/s', 'peak MB'))
+        for stage in STAGES:
+            r = stages[stage]
+            print(layout.format(stage, '{0:.4f}'.format(r['seconds']),
+                                '{0:,.0f}'.format(r['per_second']),
+                                '{0:.1f}'.format(r['peak_bytes'] / 2**20)))
+
+def bench_pipeline(sizes=(100000, 1000000), term='texas', repeat=3,
+                   output='benchmark.json', baseline=None, threshold=0.25,
+                   seed=0, term_rate=0.1):
+    """Benchmark the stages of the pipeline on the bundled tweet files and on
+    synthetic corpora of each number of lines in sizes, write the results
+    to output, and return the list of regressions against the results saved
+    in the file baseline.
+
+    The synthetic corpora come from synthetic.TweetGenerator(seed), with
+    term in the fraction term_rate of the tweets, so each size is the same
+    corpus on every run.
+
+    A corpus of 10,000,000 lines needs about 1.5 GB of disk and, because
+    load_tweets keeps every matching tweet in memory, several GB of RAM.
+    """
+    results = {}
+    for name, path, corpus_term in bundled_corpora():
+        results[name] = bench_corpus(path, corpus_term, repeat)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, CORPUS_NAME)
+            TweetGenerator(seed, term_rates={term: term_rate}).write(path,
+                                                                      size)
+            name = 'synthetic-{0}.txt'.format(size)
+            results[name] = bench_corpus(path, term, repeat)
+    print_results(results)
+    report = {'python': platform.python_version(),
+              'machine': platform.machine(),
+              'results': results}
+    if output:
+        with open(output, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=1, sort_keys=True)
+    if baseline is None:
+        return []
+    with open(baseline, encoding='utf8') as f:
+        regressions = find_regressions(results, json.load(f)['results'],
+                                       threshold)
+    for message in regressions:
+        print('Regression:', message)
+    return regressions
+
+def pipeline_command(args):
+    """Parse the command-line arguments of the pipeline benchmark and run it,
+    exiting with status 1 if any stage regressed.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog='benchmark.py pipeline',
+                                     description='Benchmark trends stages')
+    parser.add_argument('--sizes', default='100000,1000000',
+                        help='comma-separated synthetic corpus line counts')
+    parser.add_argument('--term', default='texas')
+    parser.add_argument('--term_rate', type=float, default=0.1,
+                        help='fraction of synthetic tweets containing term')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args(args)
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    if bench_pipeline(sizes, args.term, args.repeat, args.output,
+                      args.baseline, args.threshold, args.seed,
+                      args.term_rate):
+        sys.exit(1)
+
+@main
+def run(*args):
+    """Run the benchmark named by the first argument."""
+    name = args[0] if args else 'tokenizer'
+    rest = list(args[1:])
+    if name == 'pipeline':
+        return pipeline_command(rest)
+    benchmarks = {'tokenizer': bench_tokenizer}
+    if len(rest) > 1:
+        rest[1] = int(rest[1])
+    benchmarks[name](*rest)
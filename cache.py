@@ -0,0 +1,322 @@
+"""Bounded caches for the results of term queries.
+
+An LRUCache keeps values in memory and a DiskCache keeps pickled values in
+a directory.  Both evict their least recently used entries when they hold
+more than max_entries values or max_bytes bytes, and count their hits,
+misses and evictions.  A QueryCache puts an LRUCache in front of a
+DiskCache.
+
+Keys should include a fingerprint of every file that a value was computed
+from (see file_signature), so that a changed file is never answered
+from the cache; entries for old fingerprints are evicted in time.
+
+The caches may be shared by threads: each method of an LRUCache holds a
+lock, and a DiskCache writes each value to a temporary file of its own
+before renaming it into place.
+"""
+
+from collections import OrderedDict
+from itertools import islice
+import os
+import sys
+import threading
+
+def file_signature(path):
+    """Return the size and modification time that identify a file's contents."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def temporary_path(path):
+    """Return a name for a temporary file that is renamed to path once it is
+    written, unique to the calling process and thread.
+    """
+    return '{0}.{1}.{2}.tmp'.format(path, os.getpid(), threading.get_ident())
+
+def function_name(fn):
+    """Return the module and qualified name of fn, for use in a cache key,
+    or None if the name does not identify one function, as for a lambda or a
+    function defined inside another.
+
+    >>> function_name(approximate_size)
+    'cache.approximate_size'
+    >>> function_name(lambda x: x) is None
+    True
+    """
+    name = getattr(fn, '__qualname__', None)
+    module = getattr(fn, '__module__', None)
+    if module == '__main__':
+        # A script's functions are named after its file, as when imported
+        path = getattr(sys.modules['__main__'], '__file__', None)
+        module = path and os.path.splitext(os.path.basename(path))[0]
+    if not (name and module) or '<' in name:
+        return None
+    return module + '.' + name
+
+def approximate_size(value, samples=100):
+    """Return an estimate of the number of bytes used by value and the
+    objects it contains, measuring the first samples items of each container.
+
+    >>> from batch import TweetBatch
+    >>> b = TweetBatch()
+    >>> b.append('go bears', None, 38, -122)
+    >>> approximate_size(b) == b.nbytes()
+    True
+    >>> approximate_size([1.5] * 1000) > 1000 * sys.getsizeof(1.5)
+    True
+    """
+    if hasattr(value, 'nbytes') and callable(value.nbytes):
+        return value.nbytes()
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        items = list(islice(value.items(), samples))
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = list(islice(value, samples))
+    else:
+        return size
+    if not items:
+        return size
+    measured = sum(approximate_size(item, samples) for item in items)
+    return size + measured * len(value) // len(items)
+
+
+class LRUCache(object):
+    """A dictionary of recently used values, bounded in number and bytes.
+
+    sizeof -- a function from a value to its size in bytes
+
+    >>> c = LRUCache(max_entries=2, sizeof=lambda value: 10 * value)
+    >>> c.put('a', 1); c.put('b', 2)
+    >>> c.get('a'), c.get('c')
+    (1, None)
+    >>> c.put('c', 3)  # Evicts 'b', the least recently used
+    >>> 'b' in c, len(c)
+    (False, 2)
+    >>> c.stats()
+    {'hits': 1, 'misses': 1, 'evictions': 1, 'entries': 2, 'bytes': 40}
+    """
+
+    def __init__(self, max_entries=32, max_bytes=256 << 20,
+                 sizeof=approximate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.RLock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if it is not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        """Store value under key, evicting old entries to stay in bounds.
+        A value larger than max_bytes is not stored.
+        """
+        size = self.sizeof(value)
+        with self._lock:
+            self.discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while (len(self._entries) > self.max_entries or
+                   self.bytes > self.max_bytes):
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def discard(self, key):
+        """Remove the value for key, if there is one."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """Return a dictionary of counts describing the use of the cache."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self.bytes}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache(object):
+    """Pickled values stored in files in a directory, bounded in number and
+    bytes.  Reading a value marks its file as recently used.
+
+    Each file holds its key together with the value, so a hash collision
+    reads as a miss.  The directory is created when the first value is
+    stored.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     c = DiskCache(directory, max_entries=1)
+    ...     c.put(('texas', 1), [1, 2, 3])
+    ...     first = c.get(('texas', 1))
+    ...     c.put(('texas', 2), [4])
+    ...     first, c.get(('texas', 1)), c.get(('texas', 2)), c.stats()['entries']
+    ([1, 2, 3], None, [4], 1)
+    """
+
+    def __init__(self, directory, max_entries=256, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _path(self, key):
+        import hashlib
+        digest = hashlib.sha1(repr(key).encode('utf8')).hexdigest()
+        return os.path.join(self.directory, digest + '.pickle')
+
+    def get(self, key, default=None):
+        """Return the value for key, or default if it is not stored."""
+        import pickle
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError,
+                AttributeError, ImportError):
+            stored_key = None
+        with self._lock:
+            if stored_key != key:
+                self.misses += 1
+                return default
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """Store value under key, evicting old files to stay in bounds."""
+        import pickle
+        path = self._path(key)
+        tmp_path = temporary_path(path)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((key, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return  # Values that cannot be stored are only kept in memory
+        with self._lock:
+            self._evict(path)
+
+    def _files(self):
+        """Return (mtime, size, path) for each stored file, oldest first."""
+        files = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return files
+        for name in names:
+            if name.endswith('.pickle'):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime_ns, stat.st_size, path))
+        return sorted(files)
+
+    def _evict(self, newest):
+        """Remove the oldest files, but not the file newest, until the
+        cache is within its bounds.
+        """
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        files = [f for f in files if f[2] != newest] + \
+                [f for f in files if f[2] == newest]
+        while files and (len(files) > self.max_entries or
+                         total > self.max_bytes):
+            _, size, path = files.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        for _, _, path in self._files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Removed by another thread or process
+
+    def stats(self):
+        """Return a dictionary of counts describing the use of the cache."""
+        files = self._files()
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'entries': len(files),
+                    'bytes': sum(size for _, size, _ in files)}
+
+
+class QueryCache(object):
+    """An LRUCache in front of a DiskCache (which may be None).
+
+    >>> c = QueryCache(LRUCache(), None)
+    >>> c.get_or_compute('k', lambda: 'computed'), c.get_or_compute('k', None)
+    ('computed', 'computed')
+    >>> c.stats()['memory']['hits']
+    1
+    """
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+
+    def get_or_compute(self, key, compute):
+        """Return the value for key, calling compute() if it is not cached in
+        memory or on disk, and storing its result in both.
+        """
+        missing = object()
+        value = self.memory.get(key, missing)
+        if value is not missing:
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key, missing)
+        if value is missing:
+            value = compute()
+            if self.disk is not None:
+                self.disk.put(key, value)
+        self.memory.put(key, value)
+        return value
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        """Return the statistics of the memory and disk caches."""
+        return {'memory': self.memory.stats(),
+                'disk': self.disk.stats() if self.disk is not None else None}
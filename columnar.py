@@ -0,0 +1,441 @@
+"""A columnar copy of a tweet file, partitioned by date and region.
+
+    python3 columnar.py import [file_name]
+    python3 columnar.py info [file_name]
+
+import_tweets parses a tweet file once and writes its tweets to the
+directory file_name + '.columns' next to it.  The tweets are divided into
+partitions by the date they were posted and by a coarse region, a cell of
+REGION_DEGREES degrees of latitude and longitude.  Each partition keeps each
+column in its own file of packed values, in the order of the tweet file:
+
+    latitude, longitude -- float64 degrees
+    time -- int64 seconds since batch.EPOCH
+    offset -- int64 byte offset of the tweet's line in the tweet file
+    word_ids -- int32 ids of the words that have a sentiment, as indices into
+                the sorted sentiment vocabulary, for all tweets in order
+    word_ends -- int64 end of each tweet's ids in word_ids
+    sentiment -- float64 sentiment of the tweet, NaN for no sentiment
+    sentiment_count -- int32 number of words with a sentiment
+    state -- int8 index of the nearest state in the sorted state names
+
+The last three are the enrichment columns of enrichment.py, computed once
+at import.  A store is imported again when the tweet file, the sentiment
+dictionary, the state shapes or data.DERIVED_VERSION change.
+
+For every BLOCK_ROWS rows of a partition, a zone map records the smallest
+and largest value of each of ZONE_COLUMNS.  ColumnStore.read skips the
+partitions and blocks whose zone maps rule out a query, and maps only the
+column files that the query reads.
+"""
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+import marshal
+import math
+import mmap
+import os
+import shutil
+
+from aggregate import SentimentAggregate
+from batch import to_epoch
+from data import DATA_PATH, dependency_signatures, file_signature
+from enrichment import nearest_states
+from geo import us_states
+from index import open_index, words_in, is_indexable
+from mapped import MappedTweetFile
+from parsing import MalformedTweet, ParseStats, parse_tweet_line
+from scoring import default_scorer
+from tokenizer import extract_words
+from ucb import main, timed
+
+REGION_DEGREES = 10
+BLOCK_ROWS = 4096
+FORMAT = 2  # Changed whenever the layout of the files changes
+
+# The type code of each column file
+COLUMNS = {'latitude': 'd', 'longitude': 'd', 'time': 'q', 'offset': 'q',
+           'word_ids': 'i', 'word_ends': 'q', 'sentiment': 'd',
+           'sentiment_count': 'i', 'state': 'b'}
+ZONE_COLUMNS = ('latitude', 'longitude', 'time', 'offset')
+
+def columns_path(source_path):
+    """Return the directory of the columnar copy of the file at source_path."""
+    return source_path + '.columns'
+
+def region(lat, lon):
+    """Return the south-west corner of the region of a position, the cell of
+    REGION_DEGREES degrees that contains it.
+
+    >>> region(38.5, -122.0), region(-0.5, 10.0)
+    ((30, -130), (-10, 10))
+    """
+    return (math.floor(lat / REGION_DEGREES) * REGION_DEGREES,
+            math.floor(lon / REGION_DEGREES) * REGION_DEGREES)
+
+def partition_name(time, lat, lon):
+    """Return the name of the partition of a tweet.
+
+    >>> partition_name(datetime(2011, 8, 28, 19, 3, 1), 38.5, -122.0)
+    '2011-08-28_30_-130'
+    """
+    return '{0:%Y-%m-%d}_{1}_{2}'.format(time, *region(lat, lon))
+
+def sentiment_vocabulary():
+    """Return the sorted words of the sentiment dictionary, in the order of
+    the word ids of scoring.default_scorer.
+    """
+    return default_scorer().vocabulary.tolist()
+
+
+class PartitionWriter(object):
+    """The columns of one partition, written to the files in directory a
+    block of BLOCK_ROWS rows at a time while importing, so that only the
+    rows of the current block are held in memory.
+
+    rows -- the number of rows written
+    zones -- the zone maps of the blocks written (see ColumnStore.blocks)
+    """
+
+    def __init__(self, directory, state_ids):
+        self.directory = directory
+        self.state_ids = state_ids
+        self.rows = 0
+        self.words = 0  # The number of word ids written
+        self.zones = {name: ([], []) for name in ZONE_COLUMNS}
+        self.columns = {name: array(code) for name, code in COLUMNS.items()}
+        os.makedirs(directory)
+
+    def append(self, lat, lon, seconds, offset, ids):
+        columns = self.columns
+        columns['latitude'].append(lat)
+        columns['longitude'].append(lon)
+        columns['time'].append(seconds)
+        columns['offset'].append(offset)
+        columns['word_ids'].extend(ids)
+        columns['word_ends'].append(self.words + len(columns['word_ids']))
+        if len(columns['time']) == BLOCK_ROWS:
+            self.flush()
+
+    def enrich(self):
+        """Compute the enrichment columns of the rows not yet written."""
+        columns = self.columns
+        ends = columns['word_ends']
+        starts = array('q', [self.words]) + ends[:-1]
+        lengths = [end - start for start, end in zip(starts, ends)]
+        averages, counts = default_scorer().score_ids(columns['word_ids'],
+                                                      lengths)
+        columns['sentiment'] = array('d', averages.tolist())
+        columns['sentiment_count'] = array('i', counts.tolist())
+        columns['state'] = array('b', (self.state_ids[state] for state in
+                                       nearest_states(columns['latitude'],
+                                                      columns['longitude'])))
+
+    def flush(self):
+        """Enrich the rows not yet written, append them to the column files
+        and record their zone map.
+        """
+        columns = self.columns
+        if not columns['time']:
+            return
+        self.enrich()
+        for name in ZONE_COLUMNS:
+            lows, highs = self.zones[name]
+            lows.append(min(columns[name]))
+            highs.append(max(columns[name]))
+        for name, column in columns.items():
+            with open(os.path.join(self.directory, name), 'ab') as out:
+                column.tofile(out)
+        self.rows += len(columns['time'])
+        self.words += len(columns['word_ids'])
+        self.columns = {name: array(code) for name, code in COLUMNS.items()}
+
+
+@timed
+def import_tweets(source_path, stats=None):
+    """Write the columnar copy of the tweet file at source_path, replacing
+    any earlier copy, and return it opened as a ColumnStore.
+
+    stats -- an optional parsing.ParseStats that counts malformed lines
+    """
+    if stats is None:
+        stats = ParseStats()
+    vocabulary = sentiment_vocabulary()
+    word_ids = {word: i for i, word in enumerate(vocabulary)}
+    state_names = sorted(us_states)
+    state_ids = {name: i for i, name in enumerate(state_names)}
+    path = columns_path(source_path)
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    partitions = {}
+    signature = file_signature(source_path)
+    with MappedTweetFile(source_path) as f:
+        offset = 0
+        for line in f.lines():
+            line_offset, offset = offset, offset + len(line)
+            stats.lines += 1
+            line = bytes(line)
+            if not line.strip():
+                stats.blank += 1
+                continue
+            try:
+                text, time, lat, lon = parse_tweet_line(line)
+            except MalformedTweet as error:
+                stats.add_malformed(error)
+                continue
+            stats.tweets += 1
+            seconds = to_epoch(time)
+            key = (seconds // 86400,) + region(lat, lon)
+            if key not in partitions:
+                name = partition_name(time, lat, lon)
+                partitions[key] = (name, PartitionWriter(
+                    os.path.join(tmp_path, name), state_ids))
+            ids = [word_ids[w] for w in extract_words(text) if w in word_ids]
+            partitions[key][1].append(lat, lon, seconds, line_offset, ids)
+
+    meta = {}
+    for name, partition in sorted(partitions.values()):
+        partition.flush()
+        meta[name] = (partition.rows, partition.zones)
+    with open(os.path.join(tmp_path, 'meta'), 'wb') as out:
+        marshal.dump((FORMAT, signature, dependency_signatures(), vocabulary,
+                      state_names, meta), out)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return ColumnStore(source_path)
+
+
+class ColumnStore(object):
+    """A read-only columnar copy of a tweet file, written by import_tweets.
+
+    >>> import tempfile
+    >>> from index import build_index
+    >>> tmp = tempfile.mkdtemp()
+    >>> path = os.path.join(tmp, 'tweets.txt')
+    >>> _ = shutil.copy(DATA_PATH + 'texas.txt', path)
+    >>> store = import_tweets(path)
+    >>> len(store), len(store.partitions) > 1
+    (2564, True)
+    >>> build_index(path).close()  # Terms are found with the index
+    >>> rows = store.read(['time', 'word_ids'], term='welcome to texas')
+    >>> len(rows['time']), [store.vocabulary[i] for i in rows['word_ids'][0]]
+    (2, ['welcome', 'weather', 'i', 'degree', 'weather'])
+    >>> box = (29, -99, 31, -97)  # South, west, north and east around Austin
+    >>> len(store.read(['latitude'], box=box)['latitude'])
+    441
+    >>> from trends import state_aggregates_for_term
+    >>> store.state_aggregates('texas') == \\
+    ...     state_aggregates_for_term('texas', file_name='texas.txt')
+    True
+    >>> store.close()
+    >>> shutil.rmtree(tmp)
+    """
+
+    def __init__(self, source_path):
+        self.source_path = source_path
+        self.path = columns_path(source_path)
+        with open(os.path.join(self.path, 'meta'), 'rb') as f:
+            (self.format, self.signature, self.dependencies,
+             self.vocabulary, self.state_names,
+             self.partitions) = marshal.loads(f.read())
+        self._maps = {}  # (partition, column) -> (mmap, memoryview)
+
+    def is_current(self):
+        """Return whether the tweet file and the dependency_signatures are
+        unchanged since the store was written.
+        """
+        return (self.format == FORMAT and
+                self.signature == file_signature(self.source_path) and
+                self.dependencies == dependency_signatures())
+
+    def __len__(self):
+        return sum(rows for rows, _ in self.partitions.values())
+
+    def column(self, partition, name):
+        """Return a memoryview of a column file of a partition, mapping the
+        file the first time it is read.
+        """
+        key = (partition, name)
+        if key not in self._maps:
+            path = os.path.join(self.path, partition, name)
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size:
+                    m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    view = memoryview(m).cast(COLUMNS[name])
+                else:
+                    m, view = None, memoryview(array(COLUMNS[name]))
+            self._maps[key] = (m, view)
+        return self._maps[key][1]
+
+    def blocks(self, ranges, offsets=None):
+        """Yield (partition, start, end) for each block of rows that may
+        contain a row matching the query.
+
+        ranges -- a dictionary from column names in ZONE_COLUMNS to the
+                  (low, high) bounds, inclusive, of their values
+        offsets -- a sorted list of offsets, one of which a row must have
+        """
+        for partition, (rows, zones) in sorted(self.partitions.items()):
+            for block, start in enumerate(range(0, rows, BLOCK_ROWS)):
+                if not all(zones[name][0][block] <= high and
+                           zones[name][1][block] >= low
+                           for name, (low, high) in ranges.items()):
+                    continue
+                if offsets is not None:
+                    i = bisect_left(offsets, zones['offset'][0][block])
+                    if i == len(offsets) or \
+                            offsets[i] > zones['offset'][1][block]:
+                        continue
+                yield partition, start, min(start + BLOCK_ROWS, rows)
+
+    def read(self, columns, term=None, start=None, end=None, box=None):
+        """Return a dictionary from each of columns to a list of its values
+        in the rows that match a query, in the order of the partitions.
+        The values of 'word_ids' are tuples of word ids, those of 'state' are
+        state names, and a 'sentiment' is None for no sentiment.
+
+        term -- only tweets that contain term, found with the inverted index
+                of the tweet file (see term_offsets)
+        start, end -- only tweets posted at or after start and before end
+        box -- only tweets inside a (south, west, north, east) box, in degrees
+        """
+        ranges = {}
+        if start is not None or end is not None:
+            ranges['time'] = (-2 ** 63 if start is None else to_epoch(start),
+                              2 ** 63 - 1 if end is None else to_epoch(end) - 1)
+        if box is not None:
+            south, west, north, east = box
+            ranges['latitude'] = (south, north)
+            ranges['longitude'] = (west, east)
+        offsets = None
+        if term is not None:
+            offsets = term_offsets(self.source_path, term)
+            ranges['offset'] = (offsets[0], offsets[-1]) if offsets else (0, -1)
+        result = {name: [] for name in columns}
+        for partition, first, last in self.blocks(ranges, offsets):
+            rows = range(first, last)
+            if offsets is not None:
+                rows = self._rows_at(partition, first, last, offsets)
+            filters = [(self.column(partition, name), low, high)
+                       for name, (low, high) in ranges.items()
+                       if name != 'offset']
+            if filters:
+                rows = [i for i in rows if all(low <= c[i] <= high
+                                               for c, low, high in filters)]
+            for name in columns:
+                if name == 'word_ids':
+                    ids = self.column(partition, 'word_ids')
+                    ends = self.column(partition, 'word_ends')
+                    result[name].extend(
+                        tuple(ids[ends[i - 1] if i else 0:ends[i]])
+                        for i in rows)
+                elif name == 'state':
+                    states = self.column(partition, 'state')
+                    names = self.state_names
+                    result[name].extend(names[states[i]] for i in rows)
+                elif name == 'sentiment':
+                    values = self.column(partition, 'sentiment')
+                    result[name].extend(None if values[i] != values[i]
+                                        else values[i] for i in rows)
+                else:
+                    values = self.column(partition, name)
+                    result[name].extend(values[i] for i in rows)
+        return result
+
+    def state_aggregates(self, term=None, start=None, end=None, box=None):
+        """Return a dictionary from state names to the SentimentAggregate of
+        the tweets that match a query (see read), reading only the offset,
+        sentiment and state columns besides those the query filters on.
+        """
+        rows = self.read(['offset', 'sentiment', 'state'], term, start, end,
+                         box)
+        # Add the sentiments in the order of the file, as trends does
+        in_order = sorted(zip(rows['offset'], rows['sentiment'], rows['state']))
+        aggregates = {}
+        for _, sentiment, state in in_order:
+            if sentiment is not None:
+                if state not in aggregates:
+                    aggregates[state] = SentimentAggregate()
+                aggregates[state].add(sentiment)
+        return aggregates
+
+    def _rows_at(self, partition, first, last, offsets):
+        """Return the rows in [first, last) of a partition whose offsets are
+        among offsets, using the order of the offset column.
+        """
+        column = self.column(partition, 'offset')
+        low = bisect_left(offsets, column[first])
+        high = bisect_left(offsets, column[last - 1] + 1)
+        rows = []
+        for offset in offsets[low:high]:
+            i = bisect_left(column, offset, first, last)
+            if column[i] == offset:
+                rows.append(i)
+        return rows
+
+    def close(self):
+        """Release the memory maps of the column files."""
+        for m, view in self._maps.values():
+            view.release()
+            if m is not None:
+                m.close()
+        self._maps.clear()
+
+
+def term_offsets(source_path, term):
+    """Return the sorted byte offsets of the lines of the file at
+    source_path that contain term, as data.matching_lines finds them.
+    """
+    term = term.lower()
+    with MappedTweetFile(source_path) as f:
+        if is_indexable(term):
+            index = open_index(source_path)
+            spans = f.filter_spans(
+                f.spans_at(index.offsets_with_words(words_in(term))), term)
+        else:
+            spans = f.matching_spans(term)
+        return [start for start, _ in spans]
+
+_open_stores = {}
+
+def open_columns(file_name='all_tweets.txt'):
+    """Return the ColumnStore of file_name in DATA_PATH, importing the file
+    if the store is missing or out of date.
+    """
+    source_path = DATA_PATH + file_name
+    store = _open_stores.get(source_path)
+    if store is not None and store.is_current():
+        return store
+    if store is not None:
+        store.close()
+    store = None
+    if os.path.exists(os.path.join(columns_path(source_path), 'meta')):
+        store = ColumnStore(source_path)
+        if not store.is_current():
+            store.close()
+            store = None
+    if store is None:
+        print('Importing "{0}" into columns.'.format(source_path))
+        store = import_tweets(source_path)
+    _open_stores[source_path] = store
+    return store
+
+
+@main
+def run(command='info', file_name='all_tweets.txt'):
+    """Import a tweet file into columns, or describe its partitions."""
+    if command == 'import':
+        stats = ParseStats()
+        store = import_tweets(DATA_PATH + file_name, stats)
+        print(stats)
+    else:
+        store = open_columns(file_name)
+    print('{0} tweets in {1} partitions'.format(len(store),
+                                               len(store.partitions)))
+    for partition, (rows, zones) in sorted(store.partitions.items()):
+        print('{0:>22} {1:>9} rows {2:>4} blocks'.format(
+            partition, rows, len(zones['time'][0])))
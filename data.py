@@ -1,11 +1,16 @@
 """Functions for reading data from the sentiment dictionary and tweet files."""
 
+import marshal
 import os
-import re
 import string
 import sys
-from datetime import datetime
-from ucb import main, interact
+import threading
+from collections.abc import Mapping
+from batch import TweetBatch, from_epoch
+from cache import LRUCache, DiskCache, QueryCache, file_signature, \
+                  temporary_path
+from parsing import parse_tweet_lines
+from ucb import main, interact, timed
 
 # Look for data directory
 PY_PATH = sys.argv[0]
@@ -15,6 +20,7 @@ DATA_PATH = os.path.join(os.path.dirname(PY_PATH), 'data') + os.sep
 if not os.path.exists(DATA_PATH):
     DATA_PATH = 'data' + os.sep
 
+@timed
 def load_sentiments(file_name=DATA_PATH + "sentiments.csv"):
     """Read the sentiment file and return a dictionary containing the sentiment
     score of each word, a value from -1 to +1.
@@ -25,7 +31,122 @@ def load_sentiments(file_name=DATA_PATH + "sentiments.csv"):
         sentiments[word] = float(score.strip())
     return sentiments
 
-word_sentiments = load_sentiments()
+# Changed whenever sentiments, states or the cached geometry (see geometry.py)
+# are computed differently from the same data files, as by a change to
+# trends.find_center
+DERIVED_VERSION = 3
+
+def dependency_signatures():
+    """Return what the sentiments and states of tweets are computed from:
+    DERIVED_VERSION and the file_signature of the sentiment dictionary and of
+    the state shapes.
+    """
+    return (DERIVED_VERSION,
+            tuple(file_signature(DATA_PATH + 'sentiments.csv')),
+            tuple(file_signature(DATA_PATH + 'states.json')))
+
+def load_compiled(source_path, parse):
+    """Return parse(source_path), reading a compiled copy of the result when
+    one is current.
+
+    The result is stored with the marshal module in source_path + '.cache',
+    together with the source's size and modification time; the cache is
+    rebuilt whenever those change.  parse must return a value that marshal
+    can store, such as a dictionary of strings, numbers, lists and tuples.
+    """
+    cache_path = source_path + '.cache'
+    signature = file_signature(source_path)
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_signature, value = marshal.loads(f.read())
+        if cached_signature == signature:
+            return value
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    value = parse(source_path)
+    tmp_path = temporary_path(cache_path)
+    try:
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((signature, value), f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # A read-only data directory only disables the cache
+    return value
+
+
+_fill_lock = threading.RLock()
+
+class LazyDict(Mapping):
+    """A read-only dictionary whose items are loaded by calling load() on
+    first use.
+
+    Every access goes through loaded(), which returns the plain dict of
+    items; call it once to look up many keys at the speed of a built-in
+    dict.  Threads that use it first at the same time wait for one of them
+    to load it.
+
+    >>> d = LazyDict(lambda: {'good': 0.875})
+    >>> d.get('good'), 'bad' in d, len(d)
+    (0.875, False, 1)
+    >>> d.copy(), d == {'good': 0.875}
+    ({'good': 0.875}, True)
+    >>> import copy
+    >>> len(copy.copy(LazyDict(lambda: {'bad': -0.5})))
+    1
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._items = None
+
+    def loaded(self):
+        """Return the dict of items, loading it if it has not been loaded."""
+        items = self._items
+        if items is None:
+            with _fill_lock:
+                if self._items is None:
+                    self._items = dict(self._load())
+                items = self._items
+        return items
+
+    def __getitem__(self, key):
+        return self.loaded()[key]
+
+    def get(self, key, default=None):
+        return self.loaded().get(key, default)
+
+    def __contains__(self, key):
+        return key in self.loaded()
+
+    def __iter__(self):
+        return iter(self.loaded())
+
+    def __len__(self):
+        return len(self.loaded())
+
+    def __eq__(self, other):
+        if isinstance(other, LazyDict):
+            other = other.loaded()
+        return self.loaded() == other
+
+    def __repr__(self):
+        return repr(self.loaded())
+
+    def keys(self):
+        return self.loaded().keys()
+
+    def values(self):
+        return self.loaded().values()
+
+    def items(self):
+        return self.loaded().items()
+
+    def copy(self):
+        """Return a dict of the items."""
+        return self.loaded().copy()
+
+word_sentiments = LazyDict(
+    lambda: load_compiled(DATA_PATH + "sentiments.csv", load_sentiments))
 
 def file_name_for_term(term):
     """Return a valid filename that corresponds to an arbitrary term string."""
@@ -33,23 +154,127 @@ def file_name_for_term(term):
     no_space = term.replace(' ', '_')
     return ''.join(c for c in no_space if c in valid_characters) + '.txt'
 
+def is_current(derived_path, source_path):
+    """Return whether the file at derived_path exists and is at least as new
+    as the file at source_path (if there is one).
+    """
+    if not os.path.exists(derived_path):
+        return False
+    if not os.path.exists(source_path):
+        return True
+    return os.path.getmtime(derived_path) >= os.path.getmtime(source_path)
+
+@timed
 def generate_filtered_file(unfiltered_name, term):
     """Return the path to a file containing tweets that match term, generating
     that file if necessary.
+
+    A filtered file older than the unfiltered file is generated again.  The
+    unfiltered file is memory-mapped, and only the lines that may contain
+    term are decoded (see mapped.py).
     """
+    from mapped import MappedTweetFile
     filtered_path = DATA_PATH + file_name_for_term(term)
-    if not os.path.exists(filtered_path):
+    if not is_current(filtered_path, DATA_PATH + unfiltered_name):
         print('Generating filtered tweets file for "{0}".'.format(term))
-        r = re.compile('\W' + term + '\W', flags=re.IGNORECASE)
-        with open(filtered_path, mode='w', encoding='utf8') as out:
-            unfiltered = open(DATA_PATH + unfiltered_name, encoding='utf8')
-            matches = [l for l in unfiltered if term in l.lower()]
-            for line in matches:
-                if r.search(line):
-                    out.write(line)
+        tmp_path = temporary_path(filtered_path)
+        with MappedTweetFile(DATA_PATH + unfiltered_name) as unfiltered:
+            with open(tmp_path, mode='wb') as out:
+                out.writelines(unfiltered.matching_lines(term))
+        os.replace(tmp_path, filtered_path)
     return filtered_path
 
-def load_tweets(make_tweet, term='my job', file_name='all_tweets.txt'):
+def matching_lines(file_name, term):
+    """Yield the lines of file_name that contain term.
+
+    A current filtered file for term (see is_current) is read directly.
+    Otherwise, the lines are found through the inverted index of file_name,
+    which is built the first time it is needed (see index.py).
+    """
+    from index import open_index, words_in, term_pattern, is_indexable
+    filtered_path = DATA_PATH + file_name_for_term(term)
+    source_path = DATA_PATH + file_name
+    if (is_current(filtered_path, source_path)
+            or not os.path.exists(source_path) or not is_indexable(term)):
+        filtered_path = generate_filtered_file(file_name, term)
+        with open(filtered_path, encoding='utf8') as filtered:
+            yield from filtered
+    else:
+        r = term_pattern(term)
+        for line in open_index(source_path).lines_with_words(words_in(term)):
+            if term in line.lower() and r.search(line):
+                yield line
+
+
+# Parsed tweets of recent queries, in memory, and on disk once
+# use_query_directory is called (as the trends and server commands do).
+# Set to None to read the tweet files on every query.
+query_cache = QueryCache(LRUCache(max_entries=32, max_bytes=256 << 20), None)
+QUERY_VERSION = 1  # Changed whenever cached query values are computed anew
+
+def use_query_directory(directory=DATA_PATH + 'query_cache'):
+    """Keep the results of queries in directory as well as in memory, so
+    that later runs find them, or only in memory if directory is None.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryDirectory() as directory:
+    ...     use_query_directory(directory)
+    ...     value = cached_query('example', 'texas', 'texas.txt', lambda: 42)
+    ...     stored = query_cache.stats()['disk']['entries']
+    ...     use_query_directory(None)
+    >>> value, stored, query_cache.disk
+    (42, 1, None)
+    """
+    if directory is None:
+        query_cache.disk = None
+    else:
+        query_cache.disk = DiskCache(directory, max_entries=256,
+                                     max_bytes=1 << 30)
+
+def query_key(kind, term, file_name):
+    """Return a cache key for a query of kind about term in file_name.
+
+    The key holds the file_signature of the file that matching_lines reads
+    and the dependency_signatures, so a query about a changed file, or with
+    a changed sentiment dictionary or state shapes, misses the cache.
+    """
+    source_path = DATA_PATH + file_name
+    if not os.path.exists(source_path):
+        source_path = DATA_PATH + file_name_for_term(term)
+    signature = None
+    if os.path.exists(source_path):
+        signature = tuple(file_signature(source_path))
+    return (QUERY_VERSION, kind, term, os.path.abspath(source_path),
+            signature, dependency_signatures())
+
+def cached_query(kind, term, file_name, compute):
+    """Return compute(), cached under query_key(kind, term, file_name).
+    The result is shared between calls, so it must not be modified.
+    """
+    if query_cache is None:
+        return compute()
+    return query_cache.get_or_compute(query_key(kind, term, file_name),
+                                      compute)
+
+def _parse_tweet_batch(term, file_name, stats=None, enrich=False):
+    batch = TweetBatch()
+    lines = matching_lines(file_name, term)
+    for text, time, lat, lon in parse_tweet_lines(lines, stats):
+        batch.append(text, time, lat, lon)
+    if enrich:
+        from enrichment import enrich_batch  # enrichment imports this module
+        enrich_batch(batch)
+    return batch
+
+def _cached_tweet_batch(term, file_name, enrich):
+    kind = 'enriched_tweets' if enrich else 'tweets'
+    return cached_query(kind, term, file_name,
+                        lambda: _parse_tweet_batch(term, file_name,
+                                                   enrich=enrich))
+
+@timed
+def load_tweets(make_tweet, term='my job', file_name='all_tweets.txt',
+                stats=None):
     """Return the list of tweets in file_name that contain term.
 
     make_tweet -- a constructor that takes four arguments:
@@ -57,15 +282,102 @@ def load_tweets(make_tweet, term='my job', file_name='all_tweets.txt'):
       - a datetime.datetime object representing the time of the tweet
       - a longitude coordinate
       - a latitude coordinate
+    stats -- an optional parsing.ParseStats that counts malformed lines
+
+    Unless stats is given, the parsed tweets come from query_cache when they
+    are there, and are added to it otherwise.
+
+    >>> from parsing import ParseStats
+    >>> stats = ParseStats()
+    >>> len(load_tweets(lambda *fields: fields, 'my life', stats=stats))
+    2976
+    >>> stats.malformed
+    {'fields': 2}
+    >>> load_tweets(lambda *fields: fields, 'my life')[0] == \\
+    ...     load_tweets(lambda *fields: fields, 'my life', stats=stats)[0]
+    True
     """
     term = term.lower()
-    filtered_path = generate_filtered_file(file_name, term)
+    if stats is None and query_cache is not None:
+        batch = _cached_tweet_batch(term, file_name, enrich=False)
+        texts, offsets, times = batch.text_buffer, batch.offsets, batch.times
+        return [make_tweet(texts[offsets[i]:offsets[i + 1]].decode('utf8'),
+                           from_epoch(times[i]), lat, lon)
+                for i, (lat, lon) in enumerate(zip(batch.latitudes,
+                                                   batch.longitudes))]
     tweets = []
-    for line in open(filtered_path, encoding='utf8'):
-        if len(line.strip().split("\t")) >=4:
-            loc, _, time_text, text = line.strip().split("\t")
-            time = datetime.strptime(time_text, '%Y-%m-%d %H:%M:%S')
-            lat, lon = eval(loc)
-            tweet = make_tweet(text.lower(), time, lat, lon)
-            tweets.append(tweet)
+    lines = matching_lines(file_name, term)
+    for text, time, lat, lon in parse_tweet_lines(lines, stats):
+        tweet = make_tweet(text, time, lat, lon)
+        tweets.append(tweet)
     return tweets
+
+def iter_tweets(make_tweet, term='my job', file_name='all_tweets.txt',
+                stats=None):
+    """Yield the tweets in file_name that contain term, one at a time.
+
+    Unlike load_tweets, only one tweet is held in memory at a time.
+
+    >>> from trends import make_tweet
+    >>> tweets = iter_tweets(make_tweet, 'texas')
+    >>> next(tweets)['latitude']
+    38.27686618
+    """
+    term = term.lower()
+    lines = matching_lines(file_name, term)
+    for text, time, lat, lon in parse_tweet_lines(lines, stats):
+        yield make_tweet(text, time, lat, lon)
+
+def iter_tweet_batches(term='my job', file_name='all_tweets.txt',
+                       chunk_size=10000, stats=None):
+    """Yield enriched TweetBatch chunks of at most chunk_size tweets that
+    contain term.
+
+    >>> [len(b) for b in iter_tweet_batches('texas', chunk_size=1000)]
+    [1000, 1000, 564]
+    """
+    from enrichment import enrich_batch
+    term = term.lower()
+    batch = TweetBatch()
+    lines = matching_lines(file_name, term)
+    for text, time, lat, lon in parse_tweet_lines(lines, stats):
+        batch.append(text, time, lat, lon)
+        if len(batch) == chunk_size:
+            yield enrich_batch(batch)
+            batch = TweetBatch()
+    if len(batch):
+        yield enrich_batch(batch)
+
+def load_tweet_batch(term='my job', file_name='all_tweets.txt', stats=None):
+    """Return a TweetBatch of the tweets in file_name that contain term,
+    with the enrichment columns of enrichment.py.
+
+    >>> batch = load_tweet_batch('texas')
+    >>> len(batch)
+    2564
+    >>> batch[0]['time'], batch[0]['state']
+    (datetime.datetime(2011, 8, 28, 19, 3, 1), 'CA')
+
+    Batches may be loaded by several threads at once.
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> from contextlib import redirect_stdout
+    >>> from io import StringIO
+    >>> from index import open_index
+    >>> from parsing import ParseStats
+    >>> with redirect_stdout(StringIO()):  # Builds the index of texas.txt
+    ...     _ = open_index(DATA_PATH + 'texas.txt')
+    >>> terms = ['welcome', 'hot', 'weather', 'love'] * 4
+    >>> def count(term):
+    ...     return len(load_tweet_batch(term, 'texas.txt', ParseStats()))
+    >>> with ThreadPoolExecutor(8) as pool:
+    ...     counts = list(pool.map(count, terms))
+    >>> counts == [count(t) for t in terms]
+    True
+    """
+    term = term.lower()
+    if stats is None and query_cache is not None:
+        batch = TweetBatch()
+        batch.extend(_cached_tweet_batch(term, file_name, enrich=True))
+        return batch
+    return _parse_tweet_batch(term, file_name, stats, enrich=True)
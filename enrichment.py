@@ -0,0 +1,52 @@
+"""Sentiment and state columns, computed once per tweet as tweets are loaded.
+
+enrich_batch stores three values for each tweet of a TweetBatch: the
+sentiment that trends.analyze_tweet_sentiment returns, the number of words
+with a sentiment that it averages, and the state that
+trends.find_nearest_state returns.  Those functions, and the functions that
+group and average tweets, read the values from the rows of an enriched
+batch instead of computing them again.  data.load_tweet_batch,
+data.iter_tweet_batches and columnar.import_tweets enrich the tweets they
+load; data.load_tweets does not, since its tweets cannot hold the values.
+
+Sentiments are scored with scoring.SentimentScorer and states are found
+with geo.nearest_positions, a batch at a time.
+"""
+
+from geo import PositionArray, nearest_positions
+from scoring import default_scorer
+from tokenizer import extract_words_batch
+
+def nearest_states(latitudes, longitudes):
+    """Return the state whose center is closest to each location.
+
+    >>> nearest_states([38, 40.71], [-122, -74.0])
+    ['CA', 'NJ']
+    """
+    from trends import state_centers
+    centers = state_centers()
+    names = list(centers)
+    nearest = nearest_positions(PositionArray(latitudes, longitudes),
+                                list(centers.values()))
+    return [names[i] for i in nearest.tolist()]
+
+def enrich_batch(batch):
+    """Compute the enrichment columns of batch and return it.
+
+    >>> from data import load_tweets
+    >>> from trends import make_tweet, analyze_tweet_sentiment, \\
+    ...     find_nearest_state
+    >>> from batch import TweetBatch
+    >>> tweets = load_tweets(make_tweet, 'my life')
+    >>> batch = enrich_batch(TweetBatch.from_tweets(tweets))
+    >>> batch.states == [find_nearest_state(t) for t in tweets]
+    True
+    >>> [batch.sentiment(i) for i in range(len(batch))] == \\
+    ...     [analyze_tweet_sentiment(t) for t in tweets]
+    True
+    """
+    words = extract_words_batch(batch.text(i) for i in range(len(batch)))
+    averages, counts = default_scorer().score_and_count(words)
+    batch.set_enrichment(averages.tolist(), counts.tolist(),
+                         nearest_states(batch.latitudes, batch.longitudes))
+    return batch
@@ -1,8 +1,21 @@
 """Geography and projection utilities."""
 
-from data import DATA_PATH
+from data import DATA_PATH, LazyDict, load_compiled
 from math import sin, cos, atan2, radians, sqrt
 from json import JSONDecoder
+from ucb import timed
+
+np = None  # NumPy, imported when the PositionArray functions first need it
+
+def _import_numpy():
+    """Import NumPy as np, so that programs that only use the functions on
+    single positions start without it.
+    """
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
 
 def make_position(lat, lon):
     """Return a geographic position, which has a latitude and longitude."""
@@ -34,6 +47,129 @@ def geo_distance(position1, position2):
     c = 2 * atan2(sqrt(a), sqrt(1-a));
     return earth_radius * c;
 
+class PositionArray(object):
+    """Many geographic positions, stored as NumPy arrays of latitudes and
+    longitudes in radians, with the cosines of the latitudes precomputed.
+
+    lats, lons -- sequences of latitudes and longitudes in degrees, such as
+                  lists, NumPy arrays, or the columns of a batch.TweetBatch
+
+    >>> a = PositionArray.from_positions([make_position(50, 5),
+    ...                                   make_position(58, 3), (-33, 151)])
+    >>> len(a), len(a[1:])
+    (3, 2)
+    """
+
+    def __init__(self, lats, lons):
+        _import_numpy()
+        self.lats = np.radians(np.asarray(lats, dtype=np.float64))
+        self.lons = np.radians(np.asarray(lons, dtype=np.float64))
+        self.cos_lats = np.cos(self.lats)
+
+    @classmethod
+    def from_positions(cls, positions):
+        """Return a PositionArray of a sequence of geographic positions."""
+        positions = list(positions)
+        return cls([latitude(p) for p in positions],
+                   [longitude(p) for p in positions])
+
+    def __len__(self):
+        return len(self.lats)
+
+    def __getitem__(self, index):
+        """Return a PositionArray of the positions selected by a slice or an
+        array of indices, sharing the precomputed values.
+        """
+        selected = PositionArray.__new__(PositionArray)
+        selected.lats = self.lats[index]
+        selected.lons = self.lons[index]
+        selected.cos_lats = self.cos_lats[index]
+        return selected
+
+def as_position_array(positions):
+    """Return positions as a PositionArray, converting a sequence of
+    geographic positions if needed.
+    """
+    if isinstance(positions, PositionArray):
+        return positions
+    return PositionArray.from_positions(positions)
+
+def _haversine(lat1, cos1, lon1, lat2, cos2, lon2):
+    """Return the great circle distances (in miles) between positions given
+    in radians, with the same formula as geo_distance.  The arguments are
+    NumPy arrays (or scalars) that broadcast together.
+    """
+    earth_radius = 3963.2  # miles
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.sin((lon2 - lon1) / 2) ** 2 * cos1 * cos2)
+    return earth_radius * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def geo_distances(position, positions):
+    """Return a NumPy array of the distances (in miles) from one geographic
+    position to each of positions (a PositionArray or sequence of positions).
+
+    >>> import numpy as np
+    >>> positions = [make_position(58, 3), make_position(50, 5), (-33, 151)]
+    >>> distances = geo_distances(make_position(50, 5), positions)
+    >>> np.allclose(distances, [geo_distance((50, 5), p) for p in positions],
+    ...             rtol=1e-12)
+    True
+    >>> [round(d, 1) for d in distances.tolist()]
+    [559.2, 0.0, 10360.7]
+    """
+    positions = as_position_array(positions)
+    lat, lon = radians(latitude(position)), radians(longitude(position))
+    return _haversine(lat, cos(lat), lon,
+                      positions.lats, positions.cos_lats, positions.lons)
+
+def geo_distance_matrix(positions1, positions2):
+    """Return a NumPy array whose element [i, j] is the distance (in miles)
+    from positions1[i] to positions2[j].
+
+    >>> import numpy as np
+    >>> from trends import state_centers
+    >>> names = sorted(state_centers())
+    >>> centers = [state_centers()[n] for n in names]
+    >>> matrix = geo_distance_matrix(centers[:5], centers)
+    >>> matrix.shape
+    (5, 52)
+    >>> np.allclose(matrix, [[geo_distance(p, q) for q in centers]
+    ...                      for p in centers[:5]], rtol=1e-12)
+    True
+    """
+    a, b = as_position_array(positions1), as_position_array(positions2)
+    return _haversine(a.lats[:, None], a.cos_lats[:, None], a.lons[:, None],
+                      b.lats[None, :], b.cos_lats[None, :], b.lons[None, :])
+
+def nearest_positions(positions, targets, chunk_size=4096):
+    """Return a NumPy array of the index, in targets, of the target closest
+    to each of positions.  Ties go to the earliest target, as in
+    trends.find_closest_state.
+
+    positions, targets -- PositionArrays or sequences of positions
+    chunk_size -- the number of positions compared at a time, which bounds
+                  the size of the temporary distance matrix
+
+    >>> from data import load_tweets
+    >>> from trends import make_tweet, state_centers, find_closest_state
+    >>> names = list(state_centers())
+    >>> centers = PositionArray.from_positions(state_centers().values())
+    >>> tweets = load_tweets(make_tweet, 'texas')
+    >>> points = PositionArray([t['latitude'] for t in tweets],
+    ...                        [t['longitude'] for t in tweets])
+    >>> nearest = nearest_positions(points, centers, chunk_size=1000)
+    >>> all(names[i] == find_closest_state(t, state_centers())
+    ...     for i, t in zip(nearest.tolist(), tweets))
+    True
+    """
+    positions, targets = as_position_array(positions), as_position_array(targets)
+    nearest = np.empty(len(positions), dtype=np.intp)
+    for start in range(0, len(positions), chunk_size):
+        chunk = positions[start:start + chunk_size]
+        distances = geo_distance_matrix(chunk, targets)
+        nearest[start:start + chunk_size] = distances.argmin(axis=1)
+    return nearest
+
 def position_to_xy(position):
     """Convert a geographic position within the US to a planar x-y point."""
     lat = latitude(position)
@@ -78,14 +214,15 @@ _lower48 = albers_projection(make_position(38, -98), [29.5, 45.5], [480,250], 10
 _alaska = albers_projection(make_position(60, -160), [55,65], [150,440], 400)
 _hawaii = albers_projection(make_position(20, -160), [8,18], [300,450], 1000)
 
-def load_states():
+@timed
+def load_states(file_name=DATA_PATH + 'states.json'):
     """Load the coordinates of all the state outlines and return them
     in a dictionary, from names to shapes lists.
 
     >>> len(load_states()['HI'])  # Hawaii has 5 islands
     5
     """
-    json_data_file = open(DATA_PATH + 'states.json', encoding='utf8')
+    json_data_file = open(file_name, encoding='utf8')
     states = JSONDecoder().decode(json_data_file.read())
     for state, shapes in states.items():
         for index, shape in enumerate(shapes):
@@ -95,4 +232,5 @@ def load_states():
             shapes[index] = [make_position(*reversed(pos)) for pos in shape]
     return states
 
-us_states = load_states()
+us_states = LazyDict(
+    lambda: load_compiled(DATA_PATH + 'states.json', load_states))
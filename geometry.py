@@ -0,0 +1,84 @@
+"""Cached geometry of the U.S. states: centers, areas and projected outlines.
+
+Values derived from data/states.json are computed once and saved, under a
+key, in the sidecar file data/states.geometry.  The sidecar is discarded
+whenever states.json changes or data.DERIVED_VERSION is raised, as it is
+after a change to how the values are computed (for example, to
+trends.find_center).
+"""
+
+import os
+import pickle
+
+from data import DATA_PATH, DERIVED_VERSION, file_signature, temporary_path
+from geo import us_states, position_to_xy
+
+SOURCE_PATH = DATA_PATH + 'states.json'
+SIDECAR_PATH = DATA_PATH + 'states.geometry'
+FORMAT = 3  # Changed whenever the layout of the sidecar changes
+
+_cache = None
+
+def _load_sidecar():
+    """Return the values saved in the sidecar, or {} if it is missing or stale."""
+    try:
+        with open(SIDECAR_PATH, 'rb') as f:
+            signature, values = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        return {}
+    return values if signature == _sidecar_signature() else {}
+
+def _sidecar_signature():
+    return [FORMAT, DERIVED_VERSION, file_signature(SOURCE_PATH)]
+
+def cached_geometry(key, compute):
+    """Return the value saved under key, computing and saving it if needed.
+
+    compute -- a function of no arguments that derives the value from us_states
+
+    >>> projected = projected_states()
+    >>> cached_geometry('projected', _project_states) is projected
+    True
+    """
+    global _cache
+    if _cache is None:
+        _cache = _load_sidecar()
+    if key not in _cache:
+        _cache[key] = compute()
+        tmp_path = temporary_path(SIDECAR_PATH)
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((_sidecar_signature(), _cache), f)
+            os.replace(tmp_path, SIDECAR_PATH)
+        except OSError:
+            pass  # A read-only data directory only disables persistence
+    return _cache[key]
+
+def project_shapes(shapes):
+    """Return the x-y vertex lists of a list of polygons."""
+    return [[position_to_xy(position) for position in polygon]
+            for polygon in shapes]
+
+def _project_states():
+    return {name: project_shapes(shapes) for name, shapes in us_states.items()}
+
+def projected_states():
+    """Return a dictionary from state names to projected vertex lists."""
+    return cached_geometry('projected', _project_states)
+
+_names_by_id = None
+
+def projected_shapes(shapes):
+    """Return the x-y vertex lists of shapes, from the cache if shapes is one
+    of the values of us_states.
+
+    >>> projected_shapes(us_states['HI']) == project_shapes(us_states['HI'])
+    True
+    """
+    global _names_by_id
+    if _names_by_id is None:
+        _names_by_id = {id(s): name for name, s in us_states.items()}
+    name = _names_by_id.get(id(shapes))
+    if name is not None and us_states[name] is shapes:
+        return projected_states()[name]
+    return project_shapes(shapes)
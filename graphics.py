@@ -48,8 +48,12 @@ class Canvas(object):
         self._images = dict()
 
     def clear(self, shape='all'):
-        """Clear all shapes, text, and images."""
-        self._canvas.delete(shape)
+        """Clear all shapes, text, and images, or the shape with id shape, or
+        each shape in a list of ids."""
+        if isinstance(shape, list):
+            self._canvas.delete(*shape)
+        else:
+            self._canvas.delete(shape)
         if shape == 'all':
             self._draw_background()
         self._canvas.update()
@@ -79,7 +83,7 @@ class Canvas(object):
         x1, y1 = [c + radius for c in center]
         return self._canvas.create_oval(x0, y0, x1, y1, outline=color, fill=fill_color, width=width)
 
-    def draw_image(self, pos, image_file=None, scale=1, anchor=tkinter.NW):
+    def draw_image(self, pos, image_file=None, scale=1, anchor='nw'):
         """Draw an image from a file and return its tkinter id."""
         key = (image_file, scale)
         if key not in self._images:
@@ -95,7 +99,7 @@ class Canvas(object):
         return self._canvas.create_image(x, y, image=image, anchor=anchor)
 
     def draw_text(self, text, pos, color='Black', font='Arial',
-                  size=12, style='normal', anchor=tkinter.NW):
+                  size=12, style='normal', anchor='nw'):
         """Draw text and return its tkinter id."""
         x, y = pos
         font = (font, str(size), style)
@@ -111,6 +115,13 @@ class Canvas(object):
         if font is not None:
             self._canvas.itemconfigure(id, font=(font, str(size), style))
 
+    def edit_polygon(self, id, color=None, fill_color=None):
+        """Change the outline or fill color of an existing polygon or circle."""
+        if color is not None:
+            self._canvas.itemconfigure(id, outline=color)
+        if fill_color is not None:
+            self._canvas.itemconfigure(id, fill=fill_color)
+
     def animate_shape(self, id, duration, points_fn, frame_count=0):
         """Animate an existing shape over points."""
         max_frames = duration // FRAME_TIME
@@ -0,0 +1,198 @@
+"""A persistent inverted index from words to the lines of a tweet file.
+
+The index of a file is stored in two sidecar files: name.vocab holds a
+marshalled dictionary from each word to the position and length of its
+posting list, and name.idx holds every posting list as int64 byte offsets
+of lines, in file order.  The postings file is memory-mapped, so opening an
+index only reads the vocabulary.
+"""
+
+import marshal
+import mmap
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from cache import file_signature, temporary_path
+
+WORD = re.compile(r'\w+')
+
+def words_in(text):
+    """Return the set of lowercase words in text, split on non-word characters.
+
+    >>> sorted(words_in("Welcome to Texas weather..or can I"))
+    ['can', 'i', 'or', 'texas', 'to', 'weather', 'welcome']
+    """
+    return set(WORD.findall(text.lower()))
+
+def term_pattern(term):
+    """Return a regular expression that finds term between non-word characters."""
+    return re.compile(r'\W' + term + r'\W', flags=re.IGNORECASE)
+
+def is_indexable(term):
+    """Return whether the inverted index can answer queries for term.
+
+    Terms with regular expression syntax (besides whitespace and a few
+    punctuation marks) must be matched by scanning the whole file.
+
+    >>> is_indexable('my job'), is_indexable('#winning'), is_indexable('a.b')
+    (True, True, False)
+    """
+    return re.fullmatch(r"[\w\s#@'-]*\w[\w\s#@'-]*", term) is not None
+
+def build_index(source_path):
+    """Index every line of the file at source_path and write the sidecar files.
+
+    Returns the opened TermIndex.
+    """
+    postings = {}
+    offset = 0
+    with open(source_path, 'rb') as source:
+        for line in source:
+            for word in words_in(line.decode('utf8', 'replace')):
+                if word not in postings:
+                    postings[word] = array('q')
+                postings[word].append(offset)
+            offset += len(line)
+
+    # The postings are replaced before the vocabulary that points into them,
+    # so a reader never pairs a current vocabulary with old postings
+    vocabulary = {}
+    position = 0
+    idx_path = temporary_path(source_path + '.idx')
+    with open(idx_path, 'wb') as out:
+        for word, offsets in postings.items():
+            vocabulary[word] = (position, len(offsets))
+            offsets.tofile(out)
+            position += len(offsets)
+    vocab_path = temporary_path(source_path + '.vocab')
+    with open(vocab_path, 'wb') as out:
+        marshal.dump((file_signature(source_path), vocabulary), out)
+    os.replace(idx_path, source_path + '.idx')
+    os.replace(vocab_path, source_path + '.vocab')
+    return TermIndex(source_path)
+
+
+class TermIndex(object):
+    """A read-only inverted index over the lines of a source file.
+
+    >>> import tempfile, shutil
+    >>> from data import DATA_PATH
+    >>> tmp = tempfile.mkdtemp()
+    >>> path = os.path.join(tmp, 'tweets.txt')
+    >>> _ = shutil.copy(DATA_PATH + 'texas.txt', path)
+    >>> index = build_index(path)
+    >>> len(index.postings('texas'))
+    2564
+    >>> lines = list(index.lines_with_words(['welcome', 'texas']))
+    >>> len(lines), lines[0].split('\\t')[3][:26]
+    (11, 'Welcome to Texas weather..')
+
+    Each call reads the source file through its own file object, so several
+    threads may read lines at once.
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> words = [['welcome'], ['hot'], ['weather'], ['texas']] * 4
+    >>> def read(words):
+    ...     return list(index.lines_with_words(words))
+    >>> with ThreadPoolExecutor(8) as pool:
+    ...     found = list(pool.map(read, words))
+    >>> found == [read(w) for w in words]
+    True
+
+    An index may be closed while views of its postings are still in use.
+
+    >>> texas = index.postings('texas')
+    >>> index.close()
+    >>> len(texas)
+    2564
+    >>> del texas
+    >>> shutil.rmtree(tmp)
+    """
+
+    def __init__(self, source_path):
+        self.source_path = source_path
+        with open(source_path + '.vocab', 'rb') as f:
+            self.signature, self.vocabulary = marshal.loads(f.read())
+        self._postings_file = open(source_path + '.idx', 'rb')
+        if os.path.getsize(source_path + '.idx'):
+            self._map = mmap.mmap(self._postings_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            self._offsets = memoryview(self._map).cast('q')
+        else:
+            self._map, self._offsets = None, memoryview(array('q'))
+
+    def is_current(self):
+        """Return whether the source file is unchanged since the index was built."""
+        return self.signature == file_signature(self.source_path)
+
+    def postings(self, word):
+        """Return the sorted byte offsets of the lines that contain word."""
+        if word not in self.vocabulary:
+            return self._offsets[0:0]
+        start, count = self.vocabulary[word]
+        return self._offsets[start:start + count]
+
+    def offsets_with_words(self, words):
+        """Return the sorted offsets of the lines that contain all words."""
+        lists = sorted((self.postings(w) for w in set(words)), key=len)
+        if not lists:
+            return []
+        matches = []
+        for offset in lists[0]:
+            for other in lists[1:]:
+                i = bisect_left(other, offset)
+                if i == len(other) or other[i] != offset:
+                    break
+            else:
+                matches.append(offset)
+        return matches
+
+    def lines_with_words(self, words):
+        """Yield each decoded line of the source that contains all words."""
+        offsets = self.offsets_with_words(words)
+        with open(self.source_path, 'rb') as source:
+            for offset in offsets:
+                source.seek(offset)
+                yield source.readline().decode('utf8')
+
+    def close(self):
+        """Release the memory map and the postings file."""
+        self._offsets.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # Unmapped when the last postings view is collected
+        self._postings_file.close()
+
+
+_open_indexes = {}
+_open_lock = threading.Lock()
+
+def open_index(source_path):
+    """Return the index of the file at source_path, building it if it is
+    missing or older than the file.  Threads that need the same index wait
+    for one of them to build it.
+    """
+    with _open_lock:
+        return _open_index(source_path)
+
+def _open_index(source_path):
+    index = _open_indexes.get(source_path)
+    if index is not None and index.is_current():
+        return index
+    if index is not None:
+        index.close()
+    index = None
+    if os.path.exists(source_path + '.vocab'):
+        index = TermIndex(source_path)
+        if not index.is_current():
+            index.close()
+            index = None
+    if index is None:
+        print('Building term index for "{0}".'.format(source_path))
+        index = build_index(source_path)
+    _open_indexes[source_path] = index
+    return index
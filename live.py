@@ -0,0 +1,234 @@
+"""Incremental state sentiments over a live stream of tweets.
+
+A SlidingWindow keeps one dictionary of per-state SentimentAggregate
+objects for each time bucket (an hour, by default) of the most recent
+tweets.  Ingesting a tweet updates one aggregate, and a snapshot merges the
+buckets of the window, so the cost of an update depends only on the new
+tweets, never on the history that came before them.
+
+Tweets arrive as lines of text from a FileTail, which follows a growing
+tweet file, or from a SocketLines connection, a local stand-in for a
+streaming service.  Both have a non-blocking read_lines method.
+"""
+
+import os
+import socket
+
+from aggregate import SentimentAggregate, merge_aggregates
+from batch import to_epoch
+from index import term_pattern
+from parsing import parse_tweet_line, MalformedTweet, ParseStats
+
+class SlidingWindow(object):
+    """Per-state sentiment aggregates of the tweets in the latest buckets.
+
+    Buckets are numbered by the tweet times in seconds since batch.EPOCH,
+    divided by bucket_seconds.  A tweet newer than every bucket slides the
+    window forward, discarding the buckets that fall out of it; a tweet
+    older than the window is ignored.
+
+    sentiment_of -- a function from a tweet to its sentiment value or None
+    state_of -- a function from a tweet to a state name
+
+    >>> from datetime import datetime
+    >>> from trends import make_tweet
+    >>> window = SlidingWindow(lambda t: t['latitude'], lambda t: 'CA',
+    ...                        bucket_seconds=3600, buckets=2)
+    >>> for hour, value in [(1, 0.5), (2, 0.25), (2, 0.0), (3, -0.5)]:
+    ...     _ = window.ingest(make_tweet('', datetime(2012, 9, 24, hour), value, 0))
+    >>> window.snapshot()  # The tweet from 1:00 has left the window
+    {'CA': -0.08333333333333333}
+    >>> window.ingest(make_tweet('', datetime(2012, 9, 24, 0), 1.0, 0))
+    False
+    """
+
+    def __init__(self, sentiment_of, state_of, bucket_seconds=3600,
+                 buckets=24):
+        self.sentiment_of = sentiment_of
+        self.state_of = state_of
+        self.bucket_seconds = bucket_seconds
+        self.buckets = buckets
+        self.newest = None
+        self._aggregates = {}  # bucket number -> {state: SentimentAggregate}
+
+    def ingest(self, tweet):
+        """Add one tweet, and return whether it was inside the window."""
+        bucket = to_epoch(tweet['time']) // self.bucket_seconds
+        if self.newest is None or bucket > self.newest:
+            self.newest = bucket
+            oldest = bucket - self.buckets + 1
+            for old in [b for b in self._aggregates if b < oldest]:
+                del self._aggregates[old]
+        elif bucket <= self.newest - self.buckets:
+            return False
+        sentiment = self.sentiment_of(tweet)
+        if sentiment is not None:
+            states = self._aggregates.setdefault(bucket, {})
+            state = self.state_of(tweet)
+            if state not in states:
+                states[state] = SentimentAggregate()
+            states[state].add(sentiment)
+        return True
+
+    def aggregates(self):
+        """Return a dictionary from states to aggregates over the window."""
+        return merge_aggregates(self._aggregates[b]
+                                for b in sorted(self._aggregates))
+
+    def snapshot(self):
+        """Return a dictionary from states to average sentiments over the
+        window, as draw_state_sentiments expects.
+        """
+        return {state: aggregate.mean()
+                for state, aggregate in self.aggregates().items()}
+
+
+class FileTail(object):
+    """Follows a file that is being appended to, starting at offset.
+
+    read_lines returns the complete lines added since the previous call; a
+    partial last line is kept until its newline arrives.  A file that
+    shrinks below offset has been truncated, and is read again from the
+    start.
+
+    >>> import os, shutil, tempfile
+    >>> tmp = tempfile.mkdtemp()
+    >>> tail = FileTail(os.path.join(tmp, 'tweets.txt'))
+    >>> tail.read_lines()  # The file does not exist yet
+    []
+    >>> def write(text, mode='a'):
+    ...     with open(tail.path, mode) as f:
+    ...         _ = f.write(text)
+    >>> write('first\\nsecond\\nthi')
+    >>> tail.read_lines()
+    ['first\\n', 'second\\n']
+    >>> write('rd\\n')
+    >>> tail.read_lines(), tail.read_lines()
+    (['third\\n'], [])
+    >>> write('new\\n', mode='w')
+    >>> tail.read_lines()
+    ['new\\n']
+    >>> shutil.rmtree(tmp)
+    """
+
+    def __init__(self, path, offset=0, max_bytes=1 << 20):
+        self.path = path
+        self.offset = offset
+        self.max_bytes = max_bytes
+        self._partial = b''
+
+    def read_lines(self):
+        """Return a list of the new complete lines, decoded, reading at most
+        max_bytes of the file.
+        """
+        if not os.path.exists(self.path):
+            return []
+        if os.path.getsize(self.path) < self.offset:
+            self.offset, self._partial = 0, b''  # The file was truncated
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(self.max_bytes)
+        self.offset += len(chunk)
+        return _split_lines(self, chunk)
+
+    def close(self):
+        pass
+
+
+class SocketLines(object):
+    """Receives newline-separated tweet lines from a local TCP socket.
+
+    address -- a (host, port) pair
+
+    >>> import time
+    >>> server = socket.create_server(('127.0.0.1', 0))
+    >>> source = SocketLines(server.getsockname())
+    >>> peer, _ = server.accept()
+    >>> def receive():
+    ...     for _ in range(200):
+    ...         lines = source.read_lines()
+    ...         if lines or source.closed:
+    ...             return lines
+    ...         time.sleep(0.01)
+    >>> peer.sendall(b'one\\ntwo\\nthr')
+    >>> receive()
+    ['one\\n', 'two\\n']
+    >>> peer.sendall(b'ee\\n')
+    >>> receive()
+    ['three\\n']
+    >>> peer.close()
+    >>> receive(), source.closed
+    ([], True)
+    >>> source.close()
+    >>> server.close()
+    """
+
+    def __init__(self, address):
+        self._socket = socket.create_connection(address)
+        self._socket.setblocking(False)
+        self._partial = b''
+        self.closed = False
+
+    def read_lines(self):
+        """Return a list of the complete lines received so far, decoded."""
+        chunks = []
+        while not self.closed:
+            try:
+                chunk = self._socket.recv(65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                self.closed = True
+            chunks.append(chunk)
+        return _split_lines(self, b''.join(chunks))
+
+    def close(self):
+        self._socket.close()
+
+
+def _split_lines(source, chunk):
+    """Split chunk into complete lines, keeping the rest in source._partial."""
+    data = source._partial + chunk
+    lines = data.split(b'\n')
+    source._partial = lines.pop()
+    return [line.decode('utf8', 'replace') + '\n' for line in lines]
+
+
+def ingest_lines(window, lines, term, make_tweet, stats=None):
+    """Parse the lines that contain term and add their tweets to window.
+
+    Returns the number of tweets added.  Every line is counted in stats, a
+    ParseStats, and so are the tweets parsed and the malformed lines.
+
+    >>> from trends import make_tweet, analyze_tweet_sentiment, \\
+    ...     find_nearest_state
+    >>> window = SlidingWindow(analyze_tweet_sentiment, find_nearest_state)
+    >>> stats = ParseStats()
+    >>> line = '[38, -122]\\t6\\t{0}\\t{1}\\n'.format
+    >>> lines = [line('2011-08-28 19:03:01', 'good times in texas'),
+    ...          line('2011-08-28 19:04:01', 'good times in austin'),
+    ...          line('yesterday', 'texas is bad')]
+    >>> ingest_lines(window, lines, 'Texas', make_tweet, stats)
+    1
+    >>> stats
+    <ParseStats: 3 lines, 1 tweets, 0 blank, malformed {'time': 1}>
+    >>> window.snapshot()
+    {'CA': 0.6875}
+    """
+    term = term.lower()
+    r = term_pattern(term)
+    if stats is None:
+        stats = ParseStats()
+    added = 0
+    for line in lines:
+        stats.lines += 1
+        if not (term in line.lower() and r.search(line)):
+            continue
+        try:
+            text, time, lat, lon = parse_tweet_line(line)
+        except MalformedTweet as error:
+            stats.add_malformed(error)
+            continue
+        stats.tweets += 1
+        added += window.ingest(make_tweet(text, time, lat, lon))
+    return added
@@ -0,0 +1,250 @@
+"""A memory-mapped reader for tweet files that decodes only matching lines.
+
+A MappedTweetFile maps a whole tweet file into memory and hands out lines
+and text fields as memoryview slices of the map, without copying them.  To
+find the lines that contain a term, it lowercases the raw bytes a chunk at
+a time and searches them for the term with a bytes regular expression, so
+that a line is decoded only if it may contain the term.  The result is the
+same as the test in data.generate_filtered_file:
+
+    term in line.lower() and term_pattern(term).search(line)
+
+A match of an ASCII term that is_indexable accepts, in a line that is all
+ASCII, needs no further test.  Other candidate lines are decoded and
+tested; for a term with regular expression syntax or other characters, the
+candidates are the lines that contain its longest ASCII run.  Lines end at
+b'\\n'.
+"""
+
+import mmap
+import os
+import re
+import string
+
+from batch import TweetBatch
+from index import term_pattern, is_indexable
+from parsing import MalformedTweet, ParseStats, parse_location, parse_time
+
+WORD_BYTES = (string.ascii_letters + string.digits + '_').encode('ascii')
+NON_ASCII = re.compile('[^\x00-\x7f]+')
+
+# The UTF-8 encodings of the non-ASCII characters that lowercase to an ASCII
+# letter or match it in a case-insensitive regular expression
+ASCII_LOOKALIKES = {'i': ('\u0130'.encode('utf8'), '\u0131'.encode('utf8')),
+                    'k': ('\u212a'.encode('utf8'),),
+                    's': ('\u017f'.encode('utf8'),)}
+
+class MappedTweetFile(object):
+    """A read-only memory map of a tweet file.
+
+    >>> from data import DATA_PATH
+    >>> with MappedTweetFile(DATA_PATH + 'texas.txt') as f:
+    ...     lines = list(f.matching_lines('welcome to texas'))
+    ...     first = bytes(lines[0][:15])
+    ...     text, time, lat, lon = next(f.tweet_fields(f.matching_spans('fret')))
+    ...     text = bytes(text)
+    >>> len(lines), first
+    (2, b'[32.71594470000')
+    >>> text[:22], time, lat
+    (b'@swardley @GeorgeReese', datetime.datetime(2011, 8, 28, 19, 5, 32), 29.65093863)
+    """
+
+    def __init__(self, path, chunk_size=1 << 22):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._file = open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            self._map = b''
+        self.buffer = memoryview(self._map)
+
+    def __len__(self):
+        return len(self._map)
+
+    def close(self):
+        """Release the memory map and the file.  The map stays readable
+        until every memoryview of it has been released.
+        """
+        self.buffer.release()
+        if isinstance(self._map, mmap.mmap):
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # Unmapped when the last view is garbage collected
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _line_start(self, offset):
+        """Return the offset of the first line that starts at or after offset."""
+        if offset <= 0:
+            return 0
+        if self._map[offset - 1] == ord('\n'):
+            return offset
+        newline = self._map.find(b'\n', offset)
+        return len(self._map) if newline < 0 else newline + 1
+
+    def _line_end(self, offset):
+        """Return the offset just past the line that contains offset."""
+        newline = self._map.find(b'\n', offset)
+        return len(self._map) if newline < 0 else newline + 1
+
+    def spans(self, start=0, end=None):
+        """Yield the (start, end) offsets of each line whose first byte is in
+        [start, end), including its newline.
+        """
+        end = len(self._map) if end is None else min(end, len(self._map))
+        position = self._line_start(start)
+        while position < end:
+            line_end = self._line_end(position)
+            yield position, line_end
+            position = line_end
+
+    def matching_spans(self, term, start=0, end=None):
+        """Yield the (start, end) offsets of each line whose first byte is in
+        [start, end) that contains term.
+        """
+        term = term.lower()
+        r = term_pattern(term)
+        end = len(self._map) if end is None else min(end, len(self._map))
+        if term.isascii() and is_indexable(term):
+            # A match in an ASCII line of the lowercase bytes is exact
+            pattern = re.compile(re.escape(term.encode('ascii')) + rb'(?=\W)')
+            exact = True
+        else:
+            run = max(NON_ASCII.split(term), key=len)
+            if not run:
+                yield from self.filter_spans(self.spans(start, end), term)
+                return
+            pattern = re.compile(re.escape(run.encode('ascii')))
+            exact = False
+        others = [b for c, encodings in ASCII_LOOKALIKES.items() if c in term
+                  for b in encodings]
+        position = self._line_start(start)
+        while position < end:
+            chunk_end = min(position + self.chunk_size, end)
+            if chunk_end < len(self._map):
+                chunk_end = self._line_end(chunk_end - 1)
+            chunk = self._map[position:chunk_end].lower()
+            candidates = _candidate_lines(chunk, pattern, exact,
+                                          [] if chunk.isascii() else others)
+            for line_start, (line_end, found) in sorted(candidates.items()):
+                span = (position + line_start, position + line_end)
+                if not (found and chunk[line_start:line_end].isascii()):
+                    line = self._decode(span)
+                    if not (term in line.lower() and r.search(line)):
+                        continue
+                yield span
+            position = chunk_end
+
+    def spans_at(self, offsets):
+        """Yield the (start, end) offsets of the lines that start at each of
+        offsets, such as the offsets in an inverted index (see index.py).
+        """
+        for offset in offsets:
+            yield offset, self._line_end(offset)
+
+    def filter_spans(self, spans, term):
+        """Yield each of spans whose line contains term, decoding every line."""
+        term = term.lower()
+        r = term_pattern(term)
+        for span in spans:
+            line = self._decode(span)
+            if term in line.lower() and r.search(line):
+                yield span
+
+    def _decode(self, span):
+        return self._map[span[0]:span[1]].decode('utf8', 'replace')
+
+    def lines(self, start=0, end=None):
+        """Yield a memoryview of each line whose first byte is in [start, end)."""
+        for line_start, line_end in self.spans(start, end):
+            yield self.buffer[line_start:line_end]
+
+    def matching_lines(self, term, start=0, end=None):
+        """Yield a memoryview of each line in [start, end) that contains term."""
+        for line_start, line_end in self.matching_spans(term, start, end):
+            yield self.buffer[line_start:line_end]
+
+    def tweet_fields(self, spans, stats=None):
+        """Yield the (text, time, lat, lon) fields of each well-formed tweet
+        among the lines at spans, as parsing.parse_tweet_lines does for
+        bytes, except that text is a memoryview of the raw UTF-8 text, which
+        is not lowercased.  Blank and malformed lines are counted in stats
+        (a ParseStats).
+        """
+        if stats is None:
+            stats = ParseStats()
+        m, buffer = self._map, self.buffer
+        for start, end in spans:
+            stats.lines += 1
+            line = m[start:end]
+            body = line.strip()
+            if not body:
+                stats.blank += 1
+                continue
+            fields = body.split(b'\t', 3)
+            try:
+                if len(fields) != 4:
+                    raise MalformedTweet('fields', line)
+                lat, lon = parse_location(fields[0], line)
+                time = parse_time(fields[2], line)
+            except MalformedTweet as error:
+                stats.add_malformed(error)
+                continue
+            stats.tweets += 1
+            text_end = start + len(line.rstrip())
+            yield buffer[text_end - len(fields[3]):text_end], time, lat, lon
+
+    def load_batch(self, term=None, stats=None):
+        """Return a TweetBatch of the tweets that contain term, or of every
+        tweet if term is None.  Text is copied once, from the map into the
+        batch; only text that is not ASCII is decoded to be lowercased.
+        """
+        spans = self.spans() if term is None else self.matching_spans(term)
+        batch = TweetBatch()
+        for text, time, lat, lon in self.tweet_fields(spans, stats):
+            batch.append_encoded(text, time, lat, lon)
+        return batch
+
+
+def _candidate_lines(chunk, pattern, exact, others):
+    """Return a dictionary from the start of each line of chunk (lowercase
+    bytes of whole lines) that may contain a term to (end, found).
+
+    pattern -- a compiled bytes pattern that a line containing the term has
+    exact -- whether pattern is followed by a non-word byte, and found lines
+             contain the term if a word byte does not precede pattern
+    others -- encodings of characters that may stand for letters of the term
+
+    Only lines where pattern is found, or that contain any of others, are
+    candidates.  found is whether an exact pattern was found in the line.
+    """
+    candidates = {}
+    for needle in others:
+        i = chunk.find(needle)
+        while i >= 0:
+            line_start = chunk.rfind(b'\n', 0, i) + 1
+            line_end = chunk.find(b'\n', i)
+            line_end = len(chunk) if line_end < 0 else line_end + 1
+            candidates[line_start] = (line_end, False)
+            i = chunk.find(needle, line_end)
+    match = pattern.search(chunk)
+    while match:
+        i = match.start()
+        line_start = chunk.rfind(b'\n', 0, i) + 1
+        line_end = chunk.find(b'\n', i)
+        line_end = len(chunk) if line_end < 0 else line_end + 1
+        if exact and (i == line_start or chunk[i - 1] in WORD_BYTES):
+            match = pattern.search(chunk, i + 1)
+            continue
+        if line_start not in candidates:
+            candidates[line_start] = (line_end, exact)
+        match = pattern.search(chunk, line_end)
+    return candidates
@@ -1,5 +1,6 @@
 """Map drawing utilities for U.S. sentiment data."""
 
+from cache import LRUCache
 from graphics import Canvas
 from geo import position_to_xy, us_states
 
@@ -25,25 +26,49 @@ def get_sentiment_color(sentiment, sentiment_scale=4):
         index = len(SENTIMENT_COLORS) - 1
     return SENTIMENT_COLORS[index]
 
+# Canvas items that are reused between frames: the polygons and fill color of
+# each drawn state (keyed by the id of its shapes list), each state label, and
+# the message text.  The dots of the current map are removed by clear_dots.
+_state_items = {}
+_name_items = {}
+_message_item = None
+_dot_items = []
+
 def draw_state(shapes, sentiment_value=None):
     """Draw the named state in the given color on the canvas.
 
+    The polygons of a state are created the first time it is drawn; drawing
+    it again only changes their fill color, and only if the color changed.
+
     state -- a list of list of polygons (which are lists of positions)
     sentiment_value -- a number between -1 (negative) and 1 (positive)
     canvas -- the graphics.Canvas object
     """
-    for polygon in shapes:
-        vertices = [position_to_xy(position) for position in polygon]
-        color = get_sentiment_color(sentiment_value)
-        get_canvas().draw_polygon(vertices, fill_color=color)
+    color = get_sentiment_color(sentiment_value)
+    drawn = _state_items.get(id(shapes))
+    if drawn is not None and drawn[0] is shapes:
+        if drawn[2] != color:
+            for item in drawn[1]:
+                get_canvas().edit_polygon(item, fill_color=color)
+            _state_items[id(shapes)] = (shapes, drawn[1], color)
+        return
+    from geometry import projected_shapes
+    items = [get_canvas().draw_polygon(vertices, fill_color=color)
+             for vertices in projected_shapes(shapes)]
+    _state_items[id(shapes)] = (shapes, items, color)
 
 def draw_name(name, location):
-    """Draw the two-letter postal code at the center of the state.
+    """Draw the two-letter postal code at the center of the state, unless it
+    is already drawn there.
 
     location -- a position
     """
     center = position_to_xy(location)
-    get_canvas().draw_text(name.upper(), center, anchor='center', style='bold')
+    if _name_items.get(name, (None,))[0] == center:
+        return
+    item = get_canvas().draw_text(name.upper(), center, anchor='center',
+                                  style='bold')
+    _name_items[name] = (center, item)
 
 def draw_dot(location, sentiment_value=None, radius=3):
     """Draw a small dot at location.
@@ -53,29 +78,87 @@ def draw_dot(location, sentiment_value=None, radius=3):
     """
     center = position_to_xy(location)
     color = get_sentiment_color(sentiment_value)
-    get_canvas().draw_circle(center, radius, fill_color=color)
+    _dot_items.append(get_canvas().draw_circle(center, radius,
+                                               fill_color=color))
+
+def clear_dots():
+    """Remove the dots drawn since the last call, so that a new map does not
+    show the dots of an earlier one.
 
-def memoize(fn):
-    """A decorator for caching the results of the decorated function."""
-    cache = {}
+    >>> from geo import make_position
+    >>> from svgcanvas import SVGCanvas
+    >>> canvas = SVGCanvas()
+    >>> use_canvas(canvas)
+    >>> draw_dot(make_position(38, -122), 0.5)
+    >>> canvas.to_svg().count('<circle')
+    1
+    >>> clear_dots()
+    >>> canvas.to_svg().count('<circle')
+    0
+    >>> use_canvas(None)
+    """
+    if _dot_items:
+        get_canvas().clear(list(_dot_items))
+        _dot_items.clear()
+
+def memoize(fn, max_entries=128):
+    """A decorator for caching the results of the decorated function, keeping
+    the max_entries most recently used.  memoized.cache is the LRUCache.
+    """
+    cache = LRUCache(max_entries=max_entries, sizeof=lambda value: 0)
+    missing = object()
     def memoized(*args):
-        if args in cache:
-            return cache[args]
-        result = fn(*args)
-        cache[args] = result
+        result = cache.get(args, missing)
+        if result is missing:
+            result = fn(*args)
+            cache.put(args, result)
         return result
+    memoized.cache = cache
     return memoized
 
+_canvas = None
+
 @memoize
-def get_canvas():
+def get_window():
     """Return a Canvas, which is a drawing window."""
     return Canvas(width=960, height=500)
 
+def get_canvas():
+    """Return the canvas set by use_canvas, or else the drawing window."""
+    return _canvas or get_window()
+
+def use_canvas(canvas):
+    """Draw on canvas from now on, such as a headless svgcanvas.SVGCanvas.
+
+    Items reused between frames belong to the previous canvas, so they are
+    forgotten.
+    """
+    global _canvas, _message_item
+    _canvas = canvas
+    _state_items.clear()
+    _name_items.clear()
+    _dot_items.clear()
+    _message_item = None
+
 def wait(secs=0):
     """Wait for mouse click."""
     get_canvas().wait_for_click(secs)
 
 def message(s):
-    """Display a message."""
+    """Display a message, replacing the previous one."""
+    global _message_item
     c = get_canvas()
-    c.draw_text(s, (c.width//2, c.height//2), size=36, anchor='center')
+    if _message_item is None:
+        _message_item = c.draw_text(s, (c.width//2, c.height//2), size=36,
+                                    anchor='center')
+    else:
+        c.edit_text(_message_item, text=s)
+
+def clear():
+    """Remove everything from the map, including reused state polygons."""
+    global _message_item
+    get_canvas().clear()
+    _state_items.clear()
+    _name_items.clear()
+    _dot_items.clear()
+    _message_item = None
@@ -0,0 +1,134 @@
+"""Analyze many terms with a single pass over a tweet file.
+
+A TermMatcher finds every term that a line contains: it looks up the
+words of the line in a dictionary from each term's first word to the term,
+then confirms each candidate with the same test as generate_filtered_file.
+Each matching tweet is parsed, scored and assigned to a state once, no
+matter how many terms it matches.
+"""
+
+from aggregate import SentimentAggregate
+from data import DATA_PATH
+from index import words_in, WORD, term_pattern, is_indexable
+from parsing import parse_tweet_line, MalformedTweet, ParseStats
+from trends import make_tweet, analyze_tweet_sentiment, find_nearest_state
+
+class TermMatcher(object):
+    """Finds which of many terms appear in a line.
+
+    >>> matcher = TermMatcher(['my job', 'job', 'New York', 'a.b'])
+    >>> matcher.matches('I love my job!\\n')
+    ['my job', 'job']
+    >>> matcher.matches('Welcome to new york \\n')
+    ['new york']
+    >>> matcher.matches('see a.b, not axb\\n')
+    ['a.b']
+    """
+
+    def __init__(self, terms):
+        self.terms = [term.lower() for term in terms]
+        self.patterns = [term_pattern(term) for term in self.terms]
+        self.by_word = {}
+        self.always = []  # Terms with regular expression syntax
+        for i, term in enumerate(self.terms):
+            if is_indexable(term):
+                first = WORD.search(term).group()
+                self.by_word.setdefault(first, []).append(i)
+            else:
+                self.always.append(i)
+
+    def matching_indices(self, line):
+        """Return the sorted indices of the terms that line contains."""
+        candidates = list(self.always)
+        for word in words_in(line):
+            candidates.extend(self.by_word.get(word, ()))
+        if not candidates:
+            return []
+        lower = line.lower()
+        return [i for i in sorted(candidates)
+                if self.terms[i] in lower and self.patterns[i].search(line)]
+
+    def matches(self, line):
+        """Return the terms that line contains."""
+        return [self.terms[i] for i in self.matching_indices(line)]
+
+
+class TermSummary(object):
+    """The number of tweets and the sentiment aggregate, by state, of the
+    tweets that contain one term.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.aggregates = {}
+
+    def add(self, state, sentiment):
+        """Count one tweet from state with sentiment (None for no sentiment)."""
+        self.counts[state] = self.counts.get(state, 0) + 1
+        if sentiment is not None:
+            if state not in self.aggregates:
+                self.aggregates[state] = SentimentAggregate()
+            self.aggregates[state].add(sentiment)
+
+    def most_talkative_state(self):
+        """Return the state with the most tweets, as most_talkative_state does."""
+        maior, maior_estado = 0, None
+        for estado, contagem in self.counts.items():
+            if contagem >= maior:
+                maior, maior_estado = contagem, estado
+        return maior_estado
+
+    def average_sentiments(self):
+        """Return a dictionary from states to average sentiment values."""
+        return {state: aggregate.mean()
+                for state, aggregate in self.aggregates.items()}
+
+
+def scan_terms(terms, file_name='all_tweets.txt', state_of=find_nearest_state,
+               stats=None):
+    """Return a dictionary from each of terms (in lowercase) to the
+    TermSummary of the tweets in file_name that contain it, reading the file
+    once.
+
+    >>> from trends import most_talkative_state, average_sentiments, \\
+    ...     group_tweets_by_state
+    >>> from data import load_tweets
+    >>> summaries = scan_terms(['Texas', 'austin', 'houston'], 'texas.txt')
+    >>> texas = summaries['texas']
+    >>> texas.most_talkative_state() == most_talkative_state('texas')
+    True
+    >>> texas.average_sentiments() == average_sentiments(
+    ...     group_tweets_by_state(load_tweets(make_tweet, 'texas')))
+    True
+    >>> sum(summaries['austin'].counts.values())
+    147
+    """
+    matcher = TermMatcher(terms)
+    summaries = [TermSummary() for term in matcher.terms]
+    if stats is None:
+        stats = ParseStats()
+    with open(DATA_PATH + file_name, encoding='utf8') as lines:
+        for line in lines:
+            stats.lines += 1
+            indices = matcher.matching_indices(line)
+            if not indices:
+                continue
+            try:
+                text, time, lat, lon = parse_tweet_line(line)
+            except MalformedTweet as error:
+                stats.add_malformed(error)
+                continue
+            stats.tweets += 1
+            tweet = make_tweet(text, time, lat, lon)
+            sentiment = analyze_tweet_sentiment(tweet)
+            state = state_of(tweet)
+            for i in indices:
+                summaries[i].add(state, sentiment)
+    return dict(zip(matcher.terms, summaries))
+
+def most_talkative_states(terms, file_name='all_tweets.txt'):
+    """Return a dictionary from each of terms to the state with the most
+    tweets containing it, reading file_name once.
+    """
+    return {term: summary.most_talkative_state()
+            for term, summary in scan_terms(terms, file_name).items()}
@@ -0,0 +1,68 @@
+"""Compute state sentiments for a term on several processes at once.
+
+The tweet file is split into byte ranges, one per shard.  Each worker
+process filters, parses, scores and assigns to states only the lines that
+start inside its range, and returns a small dictionary of per-state
+SentimentAggregate objects.  The parent merges those aggregates into the
+same averages that average_sentiments(group_tweets_by_state(tweets))
+computes.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from aggregate import merge_aggregates
+from data import DATA_PATH, parse_tweet_lines
+from mapped import MappedTweetFile
+from trends import make_tweet, aggregate_sentiments_by_state
+
+def shard_ranges(path, shards):
+    """Split the file at path into at most shards (start, end) byte ranges.
+
+    >>> shard_ranges(DATA_PATH + 'texas.txt', 3)
+    [(0, 133100), (133100, 266200), (266200, 399300)]
+    """
+    size = os.path.getsize(path)
+    step = max(size // shards + (size % shards > 0), 1)
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+def state_aggregates(path, start, end, term):
+    """Return a dictionary from state names to SentimentAggregate objects for
+    the tweets in one byte range of path that contain term.
+    """
+    with MappedTweetFile(path) as f:
+        lines = map(bytes, f.matching_lines(term, start, end))
+        tweets = (make_tweet(text, time, lat, lon)
+                  for text, time, lat, lon in parse_tweet_lines(lines))
+        return aggregate_sentiments_by_state(tweets)
+
+def _state_aggregates(args):
+    return state_aggregates(*args)
+
+def parallel_average_sentiments(term='my job', file_name='all_tweets.txt',
+                                processes=None):
+    """Return the average sentiment by state of the tweets in file_name that
+    contain term, computed by a pool of processes.
+
+    The result equals the serial computation up to floating-point rounding,
+    since each shard sums its own tweets before the shards are combined.
+
+    >>> from data import load_tweets
+    >>> from trends import average_sentiments, group_tweets_by_state
+    >>> serial = average_sentiments(group_tweets_by_state(
+    ...     load_tweets(make_tweet, 'texas')))
+    >>> parallel = parallel_average_sentiments('texas', 'texas.txt', 4)
+    >>> sorted(parallel) == sorted(serial)
+    True
+    >>> all(abs(parallel[s] - serial[s]) < 1e-12 for s in serial)
+    True
+    """
+    term = term.lower()
+    processes = processes or os.cpu_count() or 1
+    path = DATA_PATH + file_name
+    tasks = [(path, start, end, term)
+             for start, end in shard_ranges(path, processes)]
+    with ProcessPoolExecutor(processes) as executor:
+        partials = list(executor.map(_state_aggregates, tasks))
+    return {state: aggregate.mean()
+            for state, aggregate in merge_aggregates(partials).items()}
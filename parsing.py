@@ -0,0 +1,148 @@
+"""A fast, validating parser for lines of a tweet file.
+
+Each line has four tab-separated fields:
+
+    [lat, lon]<TAB>number<TAB>YYYY-MM-DD HH:MM:SS<TAB>text
+
+Locations are split at the comma and converted with float, and times are
+checked at fixed offsets and converted with datetime.fromisoformat, instead
+of eval and datetime.strptime.  Lines may be str or bytes; for bytes, only
+the text of a well-formed line is decoded.
+"""
+
+from datetime import datetime
+
+class MalformedTweet(ValueError):
+    """A line of a tweet file that cannot be parsed.
+
+    reason -- the name of the field that is wrong: 'fields', 'location' or
+              'time'
+    """
+
+    def __init__(self, reason, line):
+        ValueError.__init__(self, 'Malformed {0}: {1!r}'.format(reason, line))
+        self.reason = reason
+        self.line = line
+
+
+class ParseStats(object):
+    """Counts of the lines seen by parse_tweet_lines.
+
+    lines -- the number of lines read, including blank lines
+    tweets -- the number of tweets parsed
+    malformed -- a dictionary from reasons to the number of malformed lines
+    examples -- up to max_examples malformed lines, with their reasons
+    """
+
+    def __init__(self, max_examples=5):
+        self.lines = 0
+        self.tweets = 0
+        self.blank = 0
+        self.malformed = {}
+        self.examples = []
+        self.max_examples = max_examples
+
+    def add_malformed(self, error):
+        """Count one MalformedTweet error."""
+        self.malformed[error.reason] = self.malformed.get(error.reason, 0) + 1
+        if len(self.examples) < self.max_examples:
+            self.examples.append((error.reason, error.line))
+
+    def __repr__(self):
+        return '<ParseStats: {0} lines, {1} tweets, {2} blank, malformed {3}>' \
+               .format(self.lines, self.tweets, self.blank, self.malformed)
+
+
+def parse_location(loc, line):
+    """Return the latitude and longitude in a '[lat, lon]' field.
+
+    >>> parse_location('[38.276866179999999, -122.03544617]', '')
+    (38.27686618, -122.03544617)
+    >>> parse_location(b'[91, 0]', '')
+    Traceback (most recent call last):
+        ...
+    parsing.MalformedTweet: Malformed location: ''
+    """
+    comma = loc.find(b',' if type(loc) == bytes else ',')
+    if comma < 0 or loc[:1] not in ('[', b'[') or loc[-1:] not in (']', b']'):
+        raise MalformedTweet('location', line)
+    try:
+        lat, lon = float(loc[1:comma]), float(loc[comma + 1:-1])
+    except ValueError:
+        raise MalformedTweet('location', line)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise MalformedTweet('location', line)
+    return lat, lon
+
+def parse_time(time_text, line):
+    """Return the datetime of a 'YYYY-MM-DD HH:MM:SS' field.
+
+    >>> parse_time('2011-08-28 19:03:01', '')
+    datetime.datetime(2011, 8, 28, 19, 3, 1)
+    >>> parse_time(b'2011-08-28 19:03:01', '')
+    datetime.datetime(2011, 8, 28, 19, 3, 1)
+    >>> parse_time('2011-08-28T19:03:01', '')
+    Traceback (most recent call last):
+        ...
+    parsing.MalformedTweet: Malformed time: ''
+    """
+    if type(time_text) == bytes:
+        time_text = time_text.decode('ascii', 'replace')
+    if (len(time_text) != 19 or time_text[4] != '-' or time_text[7] != '-'
+            or time_text[10] != ' ' or time_text[13] != ':'
+            or time_text[16] != ':'):
+        raise MalformedTweet('time', line)
+    try:
+        return datetime.fromisoformat(time_text)
+    except ValueError:
+        raise MalformedTweet('time', line)
+
+def parse_tweet_line(line):
+    """Return the (text, time, lat, lon) fields of a line of a tweet file,
+    with the text in lowercase.  Raises MalformedTweet for a bad line.
+
+    >>> parse_tweet_line('[38.5, -122.0]\\t6\\t2011-08-28 19:03:01\\tGo Bears!\\n')
+    ('go bears!', datetime.datetime(2011, 8, 28, 19, 3, 1), 38.5, -122.0)
+    >>> parse_tweet_line(b'[38.5, -122.0]\\t6\\t2011-08-28 19:03:01\\tGo\\tBears\\n')[0]
+    'go\\tbears'
+    >>> parse_tweet_line('[38.5, -122.0]\\t2011-08-28 19:03:01\\tGo Bears!')
+    Traceback (most recent call last):
+        ...
+    parsing.MalformedTweet: Malformed fields: '[38.5, -122.0]\\t2011-08-28 19:03:01\\tGo Bears!'
+    """
+    fields = line.strip().split(b'\t' if type(line) == bytes else '\t', 3)
+    if len(fields) != 4:
+        raise MalformedTweet('fields', line)
+    loc, _, time_text, text = fields
+    lat, lon = parse_location(loc, line)
+    time = parse_time(time_text, line)
+    if type(text) == bytes:
+        text = text.decode('utf8', 'replace')
+    return text.lower(), time, lat, lon
+
+def parse_tweet_lines(lines, stats=None):
+    """Yield the (text, time, lat, lon) fields of each well-formed tweet in
+    lines, counting blank and malformed lines in stats (a ParseStats).
+
+    >>> stats = ParseStats()
+    >>> lines = ['[38.5, -122.0]\\t6\\t2011-08-28 19:03:01\\tgo bears\\n', '\\n',
+    ...          '[38.5, -122.0]\\t6\\tyesterday\\toops\\n']
+    >>> [t[0] for t in parse_tweet_lines(lines, stats)]
+    ['go bears']
+    >>> stats
+    <ParseStats: 3 lines, 1 tweets, 1 blank, malformed {'time': 1}>
+    """
+    if stats is None:
+        stats = ParseStats()
+    for line in lines:
+        stats.lines += 1
+        if not line.strip():
+            stats.blank += 1
+            continue
+        try:
+            fields = parse_tweet_line(line)
+        except MalformedTweet as error:
+            stats.add_malformed(error)
+            continue
+        stats.tweets += 1
+        yield fields
@@ -0,0 +1,257 @@
+"""A long-lived JSON query service for tweet sentiments.
+
+    python3 server.py [--host HOST] [--port PORT] [--unix PATH] [--workers N]
+
+The server loads the sentiment dictionary, the state shapes and the state
+centers once, then answers HTTP GET requests such as
+
+    /average?term=texas           average sentiment and count by state
+    /hourly?term=texas            average sentiment by state, for each hour
+    /talkative?term=texas         the state with the most tweets
+    /stats                        cache and request statistics
+
+Each query takes an optional file parameter (default all_tweets.txt).
+Queries run on a thread pool, so the event loop keeps accepting requests
+while a term is scanned, and concurrent requests for the same query share
+one computation.  Results are kept in data.query_cache, in memory and in
+data/query_cache, so repeated queries are answered without reading the
+tweet file, even after a restart.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import traceback
+from urllib.parse import urlsplit, parse_qs
+
+import data
+from geo import us_states
+from spatial import center_grid
+from trends import state_centers, most_talkative_state, \
+                   state_aggregates_for_term, hourly_state_sentiments
+from ucb import main
+
+def average_query(term, file_name):
+    """Return the JSON object for an /average query."""
+    aggregates = state_aggregates_for_term(term, file_name=file_name)
+    return {'term': term,
+            'states': {state: {'average': a.mean(), 'count': a.count}
+                       for state, a in sorted(aggregates.items())}}
+
+def hourly_query(term, file_name):
+    """Return the JSON object for an /hourly query."""
+    return {'term': term,
+            'hours': hourly_state_sentiments(term, file_name)}
+
+def talkative_query(term, file_name):
+    """Return the JSON object for a /talkative query."""
+    state = data.cached_query(('talkative',), term, file_name,
+                              lambda: most_talkative_state(term, file_name))
+    return {'term': term, 'state': state}
+
+QUERIES = {'/average': average_query, '/hourly': hourly_query,
+           '/talkative': talkative_query}
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+def write_response(writer, status, body, close):
+    """Write an HTTP/1.1 response with the JSON object body to writer."""
+    payload = json.dumps(body).encode('utf8')
+    writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: '
+                 'application/json\r\nContent-Length: {2}\r\n'
+                 'Connection: {3}\r\n\r\n'.format(
+                     status, REASONS[status], len(payload),
+                     'close' if close else 'keep-alive')
+                 .encode('latin-1') + payload)
+
+
+class QueryServer(object):
+    """Answers queries on an asyncio event loop, computing them on executor.
+
+    >>> from contextlib import redirect_stdout
+    >>> from io import StringIO
+    >>> from index import open_index
+    >>> with redirect_stdout(StringIO()):  # Builds the index of texas.txt
+    ...     _ = open_index(data.DATA_PATH + 'texas.txt')
+    >>> async def demo():
+    ...     service = QueryServer()
+    ...     server = await service.start('127.0.0.1', 0)
+    ...     port = server.sockets[0].getsockname()[1]
+    ...     paths = ['/talkative?term=texas&file=texas.txt'] * 3 + [
+    ...         q + '?file=texas.txt&term=' + t for q in ('/average', '/hourly')
+    ...         for t in ('hot', 'weather', 'love')]
+    ...     answers = await asyncio.gather(
+    ...         *[fetch_json('127.0.0.1', port, p) for p in paths])
+    ...     missing = await fetch_json('127.0.0.1', port, '/average')
+    ...     server.close()
+    ...     await server.wait_closed()
+    ...     statuses = {status for status, _ in answers}
+    ...     return answers[0], statuses, missing, service.requests
+    >>> asyncio.run(demo())  # doctest: +NORMALIZE_WHITESPACE
+    ((200, {'term': 'texas', 'state': 'TX'}), {200},
+     (400, {'error': 'missing term'}), 10)
+    """
+
+    def __init__(self, executor=None):
+        self.executor = executor or ThreadPoolExecutor()
+        self.in_flight = {}  # (path, term, file name) -> asyncio.Future
+        self.requests = 0
+        self.coalesced = 0
+
+    def load(self):
+        """Load the data that every query needs, so that it stays resident."""
+        len(data.word_sentiments)
+        len(us_states)
+        center_grid(state_centers())
+
+    async def query(self, path, term, file_name):
+        """Return the result of a query, sharing the computation with an
+        identical query that is already running.
+        """
+        key = (path, term, file_name)
+        future = self.in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, QUERIES[path], term,
+                                          file_name)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda f: self.in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(future)
+
+    def stats(self):
+        """Return the JSON object for a /stats query."""
+        cache = data.query_cache.stats() if data.query_cache else None
+        return {'requests': self.requests, 'coalesced': self.coalesced,
+                'in_flight': len(self.in_flight), 'query_cache': cache}
+
+    async def respond(self, method, target):
+        """Return the (status, JSON object) answering a request."""
+        if method != 'GET':
+            return 405, {'error': 'only GET is supported'}
+        url = urlsplit(target)
+        if url.path == '/stats':
+            return 200, self.stats()
+        if url.path not in QUERIES:
+            return 404, {'error': 'unknown query ' + url.path}
+        params = parse_qs(url.query)
+        term = params.get('term', [''])[0].strip().lower()
+        if not term:
+            return 400, {'error': 'missing term'}
+        file_name = params.get('file', ['all_tweets.txt'])[0]
+        if '/' in file_name or '\\' in file_name:
+            return 400, {'error': 'file must be a name in the data directory'}
+        try:
+            return 200, await self.query(url.path, term, file_name)
+        except Exception as error:
+            return 500, {'error': '{0}: {1}'.format(type(error).__name__,
+                                                      error)}
+
+    async def handle(self, reader, writer):
+        """Answer the HTTP/1.1 requests of one connection.
+
+        An unexpected error is printed to stderr and answered with status 500.
+
+        >>> from contextlib import redirect_stderr
+        >>> from io import StringIO
+        >>> async def demo():
+        ...     server = await asyncio.start_server(QueryServer().handle,
+        ...                                         '127.0.0.1', 0)
+        ...     port = server.sockets[0].getsockname()[1]
+        ...     answer = await fetch_json('127.0.0.1', port, 'http://[bad')
+        ...     server.close()
+        ...     await server.wait_closed()
+        ...     return answer
+        >>> with redirect_stderr(StringIO()) as log:
+        ...     asyncio.run(demo())
+        (500, {'error': 'internal error'})
+        >>> 'ValueError: Invalid IPv6 URL' in log.getvalue()
+        True
+        """
+        try:
+            while True:
+                request = await reader.readline()
+                if not request.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip().lower()
+                parts = request.decode('latin-1').split()
+                self.requests += 1
+                if len(parts) != 3:
+                    status, body = 400, {'error': 'malformed request'}
+                else:
+                    status, body = await self.respond(parts[0], parts[1])
+                close = (headers.get('connection') == 'close' or
+                         parts[-1:] == ['HTTP/1.0'])
+                write_response(writer, status, body, close)
+                await writer.drain()
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        except Exception:
+            # An unexpected error is logged and answered, then the connection
+            # is closed, since the rest of the request may be unread
+            traceback.print_exc()
+            try:
+                write_response(writer, 500, {'error': 'internal error'}, True)
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8000, unix_path=None):
+        """Load the data and start serving on a TCP port, or on a Unix socket
+        at unix_path.  Returns the asyncio Server.
+        """
+        await asyncio.get_running_loop().run_in_executor(self.executor,
+                                                         self.load)
+        if unix_path:
+            return await asyncio.start_unix_server(self.handle, unix_path)
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def fetch_json(host, port, target):
+    """Send one GET request for target and return (status, JSON object)."""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write('GET {0} HTTP/1.1\r\nHost: {1}\r\nConnection: close\r\n\r\n'
+                 .format(target, host).encode('latin-1'))
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body.decode('utf8'))
+
+
+@main
+def run(*args):
+    """Start the query server and serve until interrupted."""
+    import argparse
+    parser = argparse.ArgumentParser(description='Serve tweet sentiments')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', metavar='PATH', default=None,
+                        help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='threads that compute queries')
+    args = parser.parse_args(args)
+    data.use_query_directory()
+
+    async def serve():
+        service = QueryServer(ThreadPoolExecutor(args.workers))
+        server = await service.start(args.host, args.port, args.unix)
+        print('Serving on', args.unix or '{0}:{1}'.format(args.host,
+                                                          args.port))
+        async with server:
+            await server.serve_forever()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,236 @@
+"""Spatial indexes for assigning positions to U.S. states."""
+
+from geo import geo_distance, make_position, latitude, longitude
+from math import floor
+
+class CenterGrid(object):
+    """A lookup table from latitude-longitude grid cells to the state centers
+    that can be closest to some position in that cell.
+
+    Most cells have a single candidate, so nearest() usually answers with a
+    dictionary lookup.  Otherwise it compares geo_distance to each candidate
+    in the order of the centers dictionary, so the result is always the same
+    as that of trends.find_closest_state.  Cells are filled in the first time
+    a position falls inside them.
+
+    centers -- a dictionary from state names to positions
+    cell_size -- the width and height of a cell, in degrees
+
+    >>> centers = {'A': make_position(0, 0), 'B': make_position(0, 10)}
+    >>> grid = CenterGrid(centers)
+    >>> grid.nearest(make_position(1, 2)), grid.nearest(make_position(-1, 8))
+    ('A', 'B')
+    >>> grid.candidates(make_position(1, 2))
+    ['A']
+    >>> grid.candidates(make_position(1, 5.1))
+    ['A', 'B']
+    """
+
+    def __init__(self, centers, cell_size=0.5):
+        self.centers = list(centers.items())
+        self._positions = dict(centers)
+        self.cell_size = cell_size
+        self._cells = {}
+
+    def cell(self, position):
+        """Return the (row, column) key of the cell containing position."""
+        return (floor(latitude(position) / self.cell_size),
+                floor(longitude(position) / self.cell_size))
+
+    def candidates(self, position):
+        """Return the names of the centers that may be closest to position."""
+        key = self.cell(position)
+        names = self._cells.get(key)
+        if names is None:
+            names = self._cells[key] = self._cell_candidates(key)
+        return names
+
+    def _cell_candidates(self, key):
+        """Find the centers that can be nearest to any position in a cell.
+
+        By the triangle inequality, a center can only be nearest to a
+        position in the cell if its distance from the cell's middle, less
+        the cell's radius, does not exceed the smallest distance from the
+        middle to any center plus that radius.
+        """
+        size = self.cell_size
+        south, west = key[0] * size, key[1] * size
+        middle = make_position(south + size / 2, west + size / 2)
+        boundary = [make_position(south + i * size / 2, west + j * size / 2)
+                    for i in range(3) for j in range(3) if (i, j) != (1, 1)]
+        radius = max(geo_distance(middle, p) for p in boundary) * 1.01 + 1e-6
+        distances = [geo_distance(c, middle) for _, c in self.centers]
+        limit = min(distances) + 2 * radius
+        return [name for (name, _), d in zip(self.centers, distances)
+                if d <= limit]
+
+    def nearest(self, position):
+        """Return the name of the center closest to position."""
+        names = self.candidates(position)
+        if len(names) == 1:
+            return names[0]
+        closest, smallest = None, None
+        for name in names:
+            distance = geo_distance(self._positions[name], position)
+            if smallest is None or smallest > distance:
+                closest, smallest = name, distance
+        return closest
+
+
+_grids = {}
+
+def center_grid(centers):
+    """Return a CenterGrid for centers, reusing one built for the same
+    dictionary, which must not have been modified since.
+
+    >>> from geo import us_states
+    >>> from data import load_tweets
+    >>> from trends import make_tweet, find_center, find_closest_state
+    >>> us_centers = {n: find_center(s) for n, s in us_states.items()}
+    >>> grid = center_grid(us_centers)
+    >>> tweets = load_tweets(make_tweet, 'texas')
+    >>> all(grid.nearest((t['latitude'], t['longitude'])) ==
+    ...     find_closest_state(t, us_centers) for t in tweets)
+    True
+    """
+    grid = _grids.get(id(centers))
+    if grid is None or grid[0] is not centers:
+        grid = _grids[id(centers)] = (centers, CenterGrid(centers))
+    return grid[1]
+
+
+OUTSIDE = 'outside'  # A grid cell that no state overlaps
+
+def point_in_polygon(lat, lon, lats, lons):
+    """Return whether (lat, lon) is inside a polygon, by ray casting.
+
+    lats, lons -- the vertex coordinates; the first and last may be equal
+
+    >>> point_in_polygon(1, 1, [0, 0, 2, 2], [0, 2, 2, 0])
+    True
+    >>> point_in_polygon(3, 1, [0, 0, 2, 2], [0, 2, 2, 0])
+    False
+    """
+    inside = False
+    j = len(lats) - 1
+    for i in range(len(lats)):
+        lat_i, lat_j = lats[i], lats[j]
+        if (lat_i > lat) != (lat_j > lat):
+            lon_i = lons[i]
+            if lon < (lons[j] - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i:
+                inside = not inside
+        j = i
+    return inside
+
+
+class StateLocator(object):
+    """Finds the state whose outline contains a position.
+
+    Each polygon of each state is stored with its bounding box, and a uniform
+    grid maps cells to the polygons whose boxes overlap them.  When no polygon
+    edge comes near a cell, every position in the cell has the same answer,
+    which is computed once.  Otherwise the bounding boxes of the cell's
+    polygons are checked before a ray-casting test.  Positions outside every
+    state are assigned to the closest state center, as in CenterGrid.
+
+    states -- a dictionary from state names to lists of polygons
+    centers -- a dictionary from state names to positions
+    cell_size -- the width and height of a grid cell, in degrees
+    """
+
+    def __init__(self, states, centers, cell_size=1.0):
+        self.cell_size = cell_size
+        self.nearest_center = CenterGrid(centers)
+        self.polygons = []
+        for name, shapes in states.items():
+            for polygon in shapes:
+                lats = [latitude(p) for p in polygon]
+                lons = [longitude(p) for p in polygon]
+                box = (min(lats), max(lats), min(lons), max(lons))
+                self.polygons.append((name, box, lats, lons))
+        self._cells = {}
+
+    def _cell_bounds(self, key):
+        size = self.cell_size
+        return (key[0] * size, (key[0] + 1) * size,
+                key[1] * size, (key[1] + 1) * size)
+
+    def _cell_entry(self, key):
+        """Return (polygons, answer) for a cell.  answer is a state name if
+        the whole cell lies in that state, OUTSIDE if it lies outside every
+        state, and None otherwise.
+        """
+        south, north, west, east = self._cell_bounds(key)
+        overlapping = [p for p in self.polygons
+                       if p[1][0] <= north and p[1][1] >= south
+                       and p[1][2] <= east and p[1][3] >= west]
+        for _, _, lats, lons in overlapping:
+            for i in range(len(lats)):
+                j = i - 1
+                if (min(lats[i], lats[j]) <= north and
+                        max(lats[i], lats[j]) >= south and
+                        min(lons[i], lons[j]) <= east and
+                        max(lons[i], lons[j]) >= west):
+                    return overlapping, None
+        middle = make_position((south + north) / 2, (west + east) / 2)
+        return overlapping, self._containing(middle, overlapping) or OUTSIDE
+
+    def _containing(self, position, polygons):
+        """Return the state of the first of polygons containing position."""
+        lat, lon = latitude(position), longitude(position)
+        for name, box, lats, lons in polygons:
+            if (box[0] <= lat <= box[1] and box[2] <= lon <= box[3]
+                    and point_in_polygon(lat, lon, lats, lons)):
+                return name
+        return None
+
+    def containing(self, position):
+        """Return the name of the state that contains position, or None if
+        position is outside every state.
+
+        >>> from geo import us_states
+        >>> from trends import state_centers
+        >>> locator = StateLocator(us_states, state_centers())
+        >>> locator.containing(make_position(29.0, -89.0)) is None
+        True
+        """
+        key = (floor(latitude(position) / self.cell_size),
+               floor(longitude(position) / self.cell_size))
+        entry = self._cells.get(key)
+        if entry is None:
+            entry = self._cells[key] = self._cell_entry(key)
+        polygons, answer = entry
+        if answer is None:
+            answer = self._containing(position, polygons)
+        if answer is OUTSIDE:
+            return None
+        return answer
+
+    def locate(self, position):
+        """Return the name of the state that contains position.
+
+        >>> from geo import us_states
+        >>> from trends import state_centers
+        >>> locator = StateLocator(us_states, state_centers())
+        >>> locator.locate(make_position(40.71, -74.0))  # New York City
+        'NY'
+        >>> locator.locate(make_position(37.87, -122.26))  # Berkeley
+        'CA'
+        >>> locator.locate(make_position(29.0, -89.0))  # Gulf of Mexico
+        'LA'
+        """
+        return (self.containing(position) or
+                self.nearest_center.nearest(position))
+
+_locators = {}
+
+def state_locator(states, centers):
+    """Return a StateLocator, reusing one built for the same dictionaries,
+    which must not have been modified since.
+    """
+    key = (id(states), id(centers))
+    entry = _locators.get(key)
+    if entry is None or entry[0] is not states or entry[1] is not centers:
+        entry = _locators[key] = (states, centers,
+                                  StateLocator(states, centers))
+    return entry[2]
@@ -0,0 +1,178 @@
+"""A headless drawing surface that writes SVG files.
+
+SVGCanvas has the drawing methods of graphics.Canvas that the maps module
+uses, but records shapes instead of showing them, so maps can be rendered
+without tkinter, a display or an event loop.  Call save to write the current
+drawing; the canvas can then be changed and saved again.
+"""
+
+# Escapes for XML text, as in xml.sax.saxutils, which imports urllib on load
+_TEXT_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+_ATTRIBUTE_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;',
+                                    '"': '&quot;', '\n': '&#10;',
+                                    '\r': '&#13;', '\t': '&#9;'})
+
+def escape(text):
+    """Return text escaped for the content of an XML element.
+
+    >>> escape('AT&T <3')
+    'AT&amp;T &lt;3'
+    """
+    return text.translate(_TEXT_ESCAPES)
+
+def quoteattr(text):
+    """Return text escaped and quoted for the value of an XML attribute.
+
+    >>> print(quoteattr('Arial "Bold"'))
+    "Arial &quot;Bold&quot;"
+    """
+    return '"' + text.translate(_ATTRIBUTE_ESCAPES) + '"'
+
+# SVG text-anchor and dominant-baseline values for Tk anchor names
+_ANCHORS = {
+    'center': ('middle', 'central'),
+    'n': ('middle', 'hanging'), 's': ('middle', 'text-after-edge'),
+    'e': ('end', 'central'), 'w': ('start', 'central'),
+    'nw': ('start', 'hanging'), 'ne': ('end', 'hanging'),
+    'sw': ('start', 'text-after-edge'), 'se': ('end', 'text-after-edge'),
+}
+
+class SVGCanvas(object):
+    """A Canvas replacement that renders to SVG.
+
+    draw_* methods return an id number that can be passed to edit_* methods.
+
+    >>> c = SVGCanvas(width=20, height=10)
+    >>> square = c.draw_polygon([(1, 1), (1, 5), (5, 5), (5, 1)],
+    ...                         fill_color='#AAAAAA')
+    >>> c.edit_polygon(square, fill_color='#FFFFFF')
+    >>> label = c.draw_text('CA & NV', (10, 5), anchor='center')
+    >>> print(c.to_svg())  # doctest: +ELLIPSIS
+    <svg xmlns="http://www.w3.org/2000/svg" width="20" height="10" ...>
+    <rect width="100%" height="100%" fill="White"/>
+    <polygon points="1,1 1,5 5,5 5,1" stroke="Black" fill="#FFFFFF" stroke-width="1"/>
+    <text x="10" y="5" fill="Black" font-family="Arial" font-size="12" font-weight="normal" text-anchor="middle" dominant-baseline="central">CA &amp; NV</text>
+    </svg>
+    """
+
+    def __init__(self, width=1024, height=768, color='White'):
+        self.color = color
+        self.width = width
+        self.height = height
+        self._items = {}
+        self._next_id = 1
+
+    def _add(self, item):
+        item_id = self._next_id
+        self._next_id += 1
+        self._items[item_id] = item
+        return item_id
+
+    def clear(self, shape='all'):
+        """Clear all shapes and text, or the one with id shape, or each one in
+        a list of ids."""
+        if shape == 'all':
+            self._items.clear()
+        elif isinstance(shape, list):
+            for item_id in shape:
+                self._items.pop(item_id, None)
+        else:
+            self._items.pop(shape, None)
+
+    def draw_polygon(self, points, color='Black', fill_color=None, filled=1,
+                     smooth=0, width=1):
+        """Draw a polygon and return its id.
+
+        points -- a list of (x, y) pairs encoding pixel positions
+        """
+        if fill_color is None:
+            fill_color = color
+        if filled == 0:
+            fill_color = 'none'
+        return self._add(['polygon', list(points), color, fill_color, width])
+
+    def draw_circle(self, center, radius, color='Black', fill_color=None,
+                    filled=1, width=1):
+        """Draw a circle and return its id.
+
+        center -- an (x, y) pair encoding a pixel position
+        """
+        if fill_color is None:
+            fill_color = color
+        if filled == 0:
+            fill_color = 'none'
+        return self._add(['circle', center, radius, color, fill_color, width])
+
+    def draw_text(self, text, pos, color='Black', font='Arial',
+                  size=12, style='normal', anchor='nw'):
+        """Draw text and return its id."""
+        return self._add(['text', text, pos, color, font, size, style, anchor])
+
+    def edit_text(self, id, text=None, color=None, font=None, size=12,
+                  style='normal'):
+        """Edit the text, color, or font of an existing text object."""
+        item = self._items[id]
+        if color is not None:
+            item[3] = color
+        if text is not None:
+            item[1] = text
+        if font is not None:
+            item[4:7] = [font, size, style]
+
+    def edit_polygon(self, id, color=None, fill_color=None):
+        """Change the outline or fill color of an existing polygon or circle."""
+        item = self._items[id]
+        colors = 2 if item[0] == 'polygon' else 3
+        if color is not None:
+            item[colors] = color
+        if fill_color is not None:
+            item[colors + 1] = fill_color
+
+    def wait_for_click(self, seconds=0):
+        """Return immediately; there is no window to click."""
+        return None, seconds
+
+    def to_svg(self):
+        """Return the drawing as the text of an SVG document."""
+        parts = ['<svg xmlns="http://www.w3.org/2000/svg" width="{0}" '
+                 'height="{1}" viewBox="0 0 {0} {1}">'.format(self.width,
+                                                              self.height),
+                 '<rect width="100%" height="100%" fill={0}/>'.format(
+                     quoteattr(self.color))]
+        for item in self._items.values():
+            parts.append(_ELEMENTS[item[0]](*item[1:]))
+        parts.append('</svg>')
+        return '\n'.join(parts)
+
+    def save(self, path):
+        """Write the drawing to an SVG file at path."""
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(self.to_svg())
+            f.write('\n')
+
+
+def _number(x):
+    """Format a coordinate compactly, to a hundredth of a pixel."""
+    return '{0:.2f}'.format(x).rstrip('0').rstrip('.')
+
+def _polygon(points, color, fill_color, width):
+    coords = ' '.join(_number(x) + ',' + _number(y) for x, y in points)
+    return '<polygon points="{0}" stroke={1} fill={2} stroke-width="{3}"/>' \
+           .format(coords, quoteattr(color), quoteattr(fill_color), width)
+
+def _circle(center, radius, color, fill_color, width):
+    return ('<circle cx="{0}" cy="{1}" r="{2}" stroke={3} fill={4} '
+            'stroke-width="{5}"/>').format(
+                _number(center[0]), _number(center[1]), radius,
+                quoteattr(color), quoteattr(fill_color), width)
+
+def _text(text, pos, color, font, size, style, anchor):
+    text_anchor, baseline = _ANCHORS.get(anchor, _ANCHORS['nw'])
+    weight = 'bold' if 'bold' in style else 'normal'
+    return ('<text x="{0}" y="{1}" fill={2} font-family={3} font-size="{4}" '
+            'font-weight="{5}" text-anchor="{6}" dominant-baseline="{7}">'
+            '{8}</text>').format(_number(pos[0]), _number(pos[1]),
+                                 quoteattr(color), quoteattr(font), size,
+                                 weight, text_anchor, baseline, escape(text))
+
+_ELEMENTS = {'polygon': _polygon, 'circle': _circle, 'text': _text}
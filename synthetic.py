@@ -0,0 +1,214 @@
+"""Synthetic tweet files, in the format of all_tweets.txt, for testing at scale.
+
+    python3 synthetic.py lines [file_name] [seed]
+
+The statistics of the synthetic tweets come from the bundled tweet files: the
+share of tweets from each state, the locations within each state, the hour of
+the day of each tweet, and the frequencies of words with and without
+sentiment.  A TweetGenerator draws from those statistics with its own random
+number generator, so the same seed always writes the same file.
+"""
+
+from datetime import datetime, timedelta
+from itertools import accumulate
+import random
+from statistics import median
+
+from data import DATA_PATH, word_sentiments, parse_tweet_lines
+from geo import us_states, make_position
+from spatial import point_in_polygon, state_locator
+from tokenizer import extract_words
+from ucb import main
+
+BUNDLED_FILES = ['my_life.txt', 'obama.txt', 'sandwich.txt', 'texas.txt']
+
+class CorpusProfile(object):
+    """The statistics of a collection of tweet files.
+
+    positions -- a dictionary from state names to the locations of tweets
+                 inside that state
+    shares -- a dictionary from state names to the median, over the files,
+              of the fraction of a file's tweets inside that state; a file
+              filtered for a place (texas.txt) does not skew the median
+    hours -- a list of the number of tweets posted in each hour of the day
+    sentiment_words, other_words -- lists of the words of the tweets, with
+                                    repetition, that have or lack sentiment
+
+    The words of the terms that the files were filtered for are left out of
+    other_words, so that TweetGenerator controls how often terms appear.
+    """
+
+    def __init__(self, file_names=BUNDLED_FILES):
+        from trends import state_centers
+        locator = state_locator(us_states, state_centers())
+        self.positions = {name: [] for name in us_states}
+        self.hours = [0] * 24
+        self.sentiment_words, self.other_words = [], []
+        excluded = set()
+        for file_name in file_names:
+            excluded.update(extract_words(file_name[:-4].replace('_', ' ')))
+        file_shares = []
+        for file_name in file_names:
+            counts = dict.fromkeys(us_states, 0)
+            with open(DATA_PATH + file_name, encoding='utf8') as lines:
+                for text, time, lat, lon in parse_tweet_lines(lines):
+                    state = locator.containing(make_position(lat, lon))
+                    if state is not None:
+                        self.positions[state].append((lat, lon))
+                        counts[state] += 1
+                    self.hours[time.hour] += 1
+                    for word in extract_words(text):
+                        if word in word_sentiments:
+                            self.sentiment_words.append(word)
+                        elif word not in excluded:
+                            self.other_words.append(word)
+            total = sum(counts.values()) or 1
+            file_shares.append({s: c / total for s, c in counts.items()})
+        self.shares = {name: median(shares[name] for shares in file_shares)
+                       for name in us_states}
+
+
+class TweetGenerator(object):
+    """Generates lines of synthetic tweets, in order of time.
+
+    seed -- the seed of the random number generator
+    sentiment_rate -- the fraction of words that have a sentiment
+    term_rates -- a dictionary from terms to the fraction of tweets that
+                  contain them
+    clustered -- the fraction of locations drawn near the location of a
+                 bundled tweet; the rest are uniform within a state
+    spread -- the standard deviation, in degrees, of the distance from a
+              clustered location to the bundled tweet's location
+    start, days -- the first day of the tweets and the number of days
+    words -- the smallest and largest number of words in a tweet
+
+    >>> generator = TweetGenerator(seed=1, term_rates={'my job': 0.5})
+    >>> lines = list(generator.lines(200))
+    >>> lines == list(TweetGenerator(1, term_rates={'my job': 0.5}).lines(200))
+    True
+    >>> tweets = list(parse_tweet_lines(lines))
+    >>> len(tweets), sum('my job' in text for text, _, _, _ in tweets)
+    (200, 106)
+    >>> times = [time for _, time, _, _ in tweets]
+    >>> times == sorted(times), times[0] >= datetime(2011, 8, 28)
+    (True, True)
+    >>> from trends import state_centers
+    >>> locator = state_locator(us_states, state_centers())
+    >>> all(locator.containing((lat, lon)) for _, _, lat, lon in tweets)
+    True
+    """
+
+    def __init__(self, seed=0, sentiment_rate=0.2, term_rates=None,
+                 clustered=0.8, spread=0.05, start=datetime(2011, 8, 28),
+                 days=7, words=(4, 16), profile=None):
+        self.random = random.Random(seed)
+        self.sentiment_rate = sentiment_rate
+        self.term_rates = sorted((term_rates or {}).items())
+        self.clustered = clustered
+        self.spread = spread
+        self.start = start
+        self.days = days
+        self.words = words
+        self.profile = profile or _bundled_profile()
+        from trends import state_centers
+        self.locator = state_locator(us_states, state_centers())
+        self.states = list(us_states)
+        self.state_weights = list(accumulate(
+            self.profile.shares[name] + 1e-4 for name in self.states))
+        self.polygons = {}  # state name -> (polygons, areas, boxes)
+
+    def location(self):
+        """Return a random (lat, lon) inside a state."""
+        rng = self.random
+        state = rng.choices(self.states, cum_weights=self.state_weights)[0]
+        seen = self.profile.positions[state]
+        if seen and rng.random() < self.clustered:
+            for _ in range(10):
+                lat, lon = rng.choice(seen)
+                lat += rng.gauss(0, self.spread)
+                lon += rng.gauss(0, self.spread)
+                if self.locator.containing(make_position(lat, lon)) == state:
+                    return lat, lon
+        return self.uniform_location(state)
+
+    def uniform_location(self, state):
+        """Return a (lat, lon) drawn uniformly from the area of a state."""
+        if state not in self.polygons:
+            self.polygons[state] = _polygon_table(self.locator, state)
+        polygons, areas, boxes = self.polygons[state]
+        rng = self.random
+        i = rng.choices(range(len(polygons)), cum_weights=areas)[0]
+        lats, lons = polygons[i]
+        south, north, west, east = boxes[i]
+        while True:
+            lat, lon = rng.uniform(south, north), rng.uniform(west, east)
+            if point_in_polygon(lat, lon, lats, lons):
+                return lat, lon
+
+    def text(self):
+        """Return the random text of a tweet."""
+        rng = self.random
+        sentiment, other = self.profile.sentiment_words, self.profile.other_words
+        n = rng.randint(*self.words)
+        k = sum(rng.random() < self.sentiment_rate for _ in range(n))
+        words = rng.choices(sentiment, k=k) + rng.choices(other, k=n - k)
+        rng.shuffle(words)
+        for term, rate in self.term_rates:
+            if rng.random() < rate:
+                words.insert(rng.randint(0, len(words)), term)
+        return ' '.join(words)
+
+    def times(self, n):
+        """Yield n datetimes in order, distributed over the hours of the days
+        in proportion to the hours of the bundled tweets.
+        """
+        rng = self.random
+        weights = [self.profile.hours[hour] + 1
+                   for _ in range(self.days) for hour in range(24)]
+        total, expected, count = sum(weights), 0, 0
+        for bucket, weight in enumerate(weights):
+            expected += weight
+            k = round(n * expected / total) - count
+            count += k
+            hour = self.start + timedelta(hours=bucket)
+            for second in sorted(rng.randrange(3600) for _ in range(k)):
+                yield hour + timedelta(seconds=second)
+
+    def lines(self, n):
+        """Yield n lines of synthetic tweets, in order of time."""
+        for time in self.times(n):
+            lat, lon = self.location()
+            yield '[{0!r}, {1!r}]\t6\t{2}\t{3}\n'.format(
+                round(lat, 8), round(lon, 8), time, self.text())
+
+    def write(self, path, n):
+        """Write n lines of synthetic tweets to the file at path."""
+        with open(path, 'w', encoding='utf8') as out:
+            out.writelines(self.lines(n))
+
+
+def _polygon_table(locator, name):
+    """Return the vertex lists, cumulative areas and bounding boxes of the
+    polygons of the state name, as stored by the spatial.StateLocator locator.
+    """
+    from trends import polygon_area
+    entries = [p for p in locator.polygons if p[0] == name]
+    areas = list(accumulate(abs(polygon_area(polygon))
+                            for polygon in us_states[name]))
+    return ([(lats, lons) for _, _, lats, lons in entries], areas,
+            [box for _, box, _, _ in entries])
+
+_profile = None
+
+def _bundled_profile():
+    """Return the CorpusProfile of the bundled files, computed once."""
+    global _profile
+    if _profile is None:
+        _profile = CorpusProfile()
+    return _profile
+
+
+@main
+def run(lines, file_name='synthetic.txt', seed=0):
+    """Write a synthetic tweet file of the given number of lines to DATA_PATH."""
+    TweetGenerator(int(seed)).write(DATA_PATH + file_name, int(lines))
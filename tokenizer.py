@@ -0,0 +1,39 @@
+"""Fast extraction of words, the runs of ASCII letters in a text.
+
+Both functions encode text to ASCII (non-ASCII characters become '?') and
+map every byte that is not a letter to a space with one bytes.translate
+call, so the only per-character work happens in C.
+"""
+
+from string import ascii_letters
+
+_LETTERS = ascii_letters.encode('ascii')
+WORD_TABLE = bytes(c if c in _LETTERS else ord(' ') for c in range(256))
+# Like WORD_TABLE, but turns the NUL separators of a batch into newlines
+BATCH_TABLE = b'\n' + WORD_TABLE[1:]
+
+def extract_words(text):
+    """Return the words in text, in order.
+
+    >>> extract_words("paperclips! they're so awesome, cool, & useful!")
+    ['paperclips', 'they', 're', 'so', 'awesome', 'cool', 'useful']
+    >>> extract_words('caf\\xe9 ol\\xe9')
+    ['caf', 'ol']
+    """
+    return text.encode('ascii', 'replace').translate(WORD_TABLE) \
+               .decode('ascii').split()
+
+def extract_words_batch(texts):
+    """Return a list of the words in each of texts, tokenizing all of them
+    with a single translate call.
+
+    >>> extract_words_batch(['i love my job. #winning', '', 'go\\nbears'])
+    [['i', 'love', 'my', 'job', 'winning'], [], ['go', 'bears']]
+    """
+    texts = list(texts)
+    joined = '\0'.join(texts)
+    if joined.count('\0') != max(len(texts) - 1, 0):
+        return [extract_words(text) for text in texts]  # NUL inside a text
+    lines = joined.encode('ascii', 'replace').translate(BATCH_TABLE) \
+                  .decode('ascii').split('\n')
+    return [line.split() for line in lines] if texts else []
@@ -1,12 +1,19 @@
 """Grupo: Ewerton de Jesus e Matheus gurjao"""
 
-from data import word_sentiments, load_tweets
+from batch import TweetBatch, from_epoch, NO_TIME
+from cache import function_name
+from data import word_sentiments, load_tweets, iter_tweets, load_tweet_batch, \
+                 iter_tweet_batches, file_name_for_term, cached_query
+import data
 from datetime import datetime
 from doctest import run_docstring_examples
-from geo import us_states, geo_distance, make_position, longitude, latitude
-from maps import draw_state, draw_name, draw_dot, wait, message
-from string import ascii_letters
-from ucb import main, trace, interact, log_current_line
+import os
+from geo import us_states, geo_distance, geo_distances, make_position, \
+                longitude, latitude
+from maps import draw_state, draw_name, draw_dot, clear_dots, wait, message, \
+                 clear, use_canvas
+import tokenizer
+from ucb import main, trace, interact, log_current_line, timed, profiling
 
 
 # Phase 1: The Feelings in Tweets
@@ -64,15 +71,9 @@ def extract_words(text):
     >>> extract_words("paperclips! they're so awesome, cool, & useful!")
     ['paperclips', 'they', 're', 'so', 'awesome', 'cool', 'useful']
     """
-    # para cada caractere na palavra verifica se eh uma letra ascii
-    # retorna a frase dividida por palavras
-    sempontuacao = ''
-    for elemento in text:
-        if elemento in ascii_letters:
-            sempontuacao += elemento
-        else:
-            sempontuacao += ' '
-    return sempontuacao.split()
+    # troca tudo que nao for letra ascii por espaco com uma tabela de
+    # traducao (ver tokenizer.py) e retorna a frase dividida por palavras
+    return tokenizer.extract_words(text)
 
 
 def make_sentiment(value):
@@ -146,6 +147,10 @@ def analyze_tweet_sentiment(tweet):
     False
 
     """
+    # um tweet enriquecido (ver enrichment.py) ja traz o sentimento calculado
+    if 'sentiment' in tweet:
+        return tweet['sentiment']
+
     palavras = tweet_words(tweet)
     valor_total = 0.0
     numero_palavras = 0
@@ -269,12 +274,46 @@ def find_center(polygons):
     >>> round(longitude(hi), 5)
     -156.21763
     """
-    # dado o retorno do us_states[estado] pega o unico elemento e retorna seu
-    # centroid
+    # media dos centroids de todos os poligonos do estado, ponderada pela
+    # area de cada poligono
+    soma_latitude = 0
+    soma_longitude = 0
+    area_total = 0
+    for poligono in polygons:
+        lat, lon, area = find_centroid(poligono)
+        soma_latitude += lat * area
+        soma_longitude += lon * area
+        area_total += area
+
+    # estados sem area usam o centroid do primeiro poligono
+    if area_total == 0:
+        centroid = find_centroid(polygons[0])
+        return (centroid[0], centroid[1])
+
+    return (soma_latitude / area_total, soma_longitude / area_total)
+
+
+def state_centers():
+    """Return a dictionary from state names to their centers.
+
+    The centers are computed with find_center once and cached (see
+    geometry.py); do not modify the returned dictionary.
+
+    >>> state_centers()['CA'] == find_center(us_states['CA'])
+    True
+    """
+    from geometry import cached_geometry
+    return cached_geometry('centers', lambda: {
+        n: find_center(s) for n, s in us_states.items()})
 
-    centroid = find_centroid(polygons[0])
 
-    return (centroid[0], centroid[1])
+def state_areas():
+    """Return a dictionary from state names to the total area of their
+    polygons, in square degrees, computed once and cached.
+    """
+    from geometry import cached_geometry
+    return cached_geometry('areas', lambda: {
+        n: sum(find_centroid(p)[2] for p in s) for n, s in us_states.items()})
 
 # Phase 3: The Mood of the Nation
 
@@ -314,32 +353,74 @@ def find_closest_state(tweet, state_centers):
     return iniciais
 
 
-def group_tweets_by_state(tweets):
+def find_nearest_state(tweet):
+    """Return the name of the state whose center is closest to the tweet.
+
+    Gives the same answer as find_closest_state(tweet, state_centers()),
+    using the cached grid of spatial.CenterGrid, or the state stored in an
+    enriched tweet (see enrichment.py).
+    """
+    if 'state' in tweet:
+        return tweet['state']
+    from spatial import center_grid
+    return center_grid(state_centers()).nearest(tweet_location(tweet))
+
+
+def find_containing_state(tweet):
+    """Return the name of the state whose outline contains the tweet's
+    location.  Tweets outside every state (offshore, for example) are assigned
+    to the closest state center.
+
+    >>> ny = make_tweet("Welcome to New York", None, 40.71, -74.0)
+    >>> find_closest_state(ny, state_centers()), find_containing_state(ny)
+    ('NJ', 'NY')
+    """
+    from spatial import state_locator
+    return state_locator(us_states, state_centers()).locate(
+        tweet_location(tweet))
+
+
+@timed
+def group_tweets_by_state(tweets, state_of=find_nearest_state):
     """Return a dictionary that aggregates tweets by their nearest state center.
 
     The keys of the returned dictionary are state names, and the values are
     lists of tweets that appear closer to that state center than any other.
 
-    tweets -- a sequence of tweet abstract data types
+    tweets -- a sequence of tweet abstract data types, or a TweetBatch; the
+              values are batches as well when tweets is a TweetBatch
+    state_of -- a function from a tweet to a state name; pass
+                find_containing_state to group by state outlines instead
 
     >>> sf = make_tweet("Welcome to San Francisco", None, 38, -122)
     >>> ny = make_tweet("Welcome to New York", None, 41, -74)
     >>> ca_tweets = group_tweets_by_state([sf, ny])['CA']
     >>> tweet_string(ca_tweets[0])
     '"Welcome to San Francisco" @ (38, -122)'
+    >>> batch = TweetBatch.from_tweets([sf, ny])
+    >>> group_tweets_by_state(batch)['CA']
+    <TweetBatch of 1 tweets>
     """
     tweets_by_state = {}
-    us_centers = {}
 
-    # gera dicionario us center com o estado como chave e seu centro como valor
-    for estado, poligono in us_states.items():
-        us_centers[estado] = find_center(poligono)
+    # para um TweetBatch agrupa os indices e copia as colunas de cada estado
+    if isinstance(tweets, TweetBatch):
+        indices_by_state = {}
+        # um lote enriquecido ja tem a coluna com o estado mais proximo
+        if state_of is find_nearest_state and tweets.is_enriched():
+            estados = tweets.states
+        else:
+            estados = [state_of(tweet) for tweet in tweets]
+        for indice, estado_mais_proximo in enumerate(estados):
+            indices_by_state.setdefault(estado_mais_proximo, []).append(indice)
+        return {estado: tweets.subset(indices)
+                for estado, indices in indices_by_state.items()}
 
     # para cada tweet verifica qual estado mais proximo e os agrupa por estado
     # se exite a chave concatena a lista [tweet]
     # se nao existe, cria a chave com a lista [tweet]
     for tweet in tweets:
-        estado_mais_proximo = find_closest_state(tweet, us_centers)
+        estado_mais_proximo = state_of(tweet)
         if estado_mais_proximo in tweets_by_state:
             tweets_by_state[estado_mais_proximo] += [tweet]
         else:
@@ -348,7 +429,8 @@ def group_tweets_by_state(tweets):
     return tweets_by_state
 
 
-def most_talkative_state(term):
+@timed
+def most_talkative_state(term, file_name='all_tweets.txt'):
     """Return the state that has the largest number of tweets containing term.
 
     >>> most_talkative_state('texas')
@@ -356,7 +438,8 @@ def most_talkative_state(term):
     >>> most_talkative_state('sandwich')
     'NJ'
     """
-    tweets = load_tweets(make_tweet, term)
+    # o lote enriquecido ja traz o estado de cada tweet
+    tweets = load_tweet_batch(term, file_name)
     # agrupa os tweets por estado
     por_estado = group_tweets_by_state(tweets)
     maior = 0
@@ -371,6 +454,7 @@ def most_talkative_state(term):
     return maior_estado
 
 
+@timed
 def average_sentiments(tweets_by_state):
     """Calculate the average sentiment of the states by averaging over all
     the tweets from each state. Return the result as a dictionary from state
@@ -381,8 +465,15 @@ def average_sentiments(tweets_by_state):
     tweets that have no sentiment, as 0.  0 represents neutral sentiment, not
     unknown sentiment.
 
-    tweets_by_state -- A dictionary from state names to lists of tweets
+    tweets_by_state -- A dictionary from state names to lists of tweets,
+                       TweetBatch objects or SentimentAggregate objects
+
+    >>> sf = make_tweet("i love my job", None, 38, -122)
+    >>> batch = TweetBatch.from_tweets([sf])
+    >>> average_sentiments({'CA': [sf]}) == average_sentiments({'CA': batch})
+    True
     """
+    from aggregate import SentimentAggregate
     averaged_state_sentiments = {}
     # para cada estado como chave no dicionario tweets_by_state
     # verifica qual a soma das medias dos valores dos sentimentos de cada tweet
@@ -394,8 +485,19 @@ def average_sentiments(tweets_by_state):
         numero_tweets_com_sentimentos = 0
 
         list_tweets_estado = tweets_by_state[estado]
-        for tweet in list_tweets_estado:
-            media_tweet = analyze_tweet_sentiment(tweet)
+        # um agregado ja tem a soma e a contagem dos sentimentos
+        if isinstance(list_tweets_estado, SentimentAggregate):
+            if list_tweets_estado.count != 0:
+                averaged_state_sentiments[estado] = list_tweets_estado.mean()
+            continue
+        # um lote enriquecido ja tem a coluna de sentimentos (NaN se nao tem)
+        if isinstance(list_tweets_estado, TweetBatch) and \
+                list_tweets_estado.is_enriched():
+            medias = [s if s == s else None
+                      for s in list_tweets_estado.sentiments]
+        else:
+            medias = map(analyze_tweet_sentiment, list_tweets_estado)
+        for media_tweet in medias:
             if media_tweet is not None:
                 numero_tweets_com_sentimentos += 1
                 soma_estado += media_tweet
@@ -407,9 +509,111 @@ def average_sentiments(tweets_by_state):
     return averaged_state_sentiments
 
 
+@timed
+def aggregate_sentiments(tweets, key):
+    """Return a dictionary from each value of key(tweet) to a
+    SentimentAggregate of the sentiments of the tweets with that key.
+
+    Tweets without sentiment are skipped, so keys with no sentiment are left
+    out.  tweets is consumed in a single pass and is not kept in memory.
+
+    tweets -- an iterable of tweets, such as the generator from iter_tweets
+    key -- a function from a tweet to a dictionary key
+    """
+    from aggregate import SentimentAggregate
+    agregados = {}
+    for tweet in tweets:
+        media_tweet = analyze_tweet_sentiment(tweet)
+        if media_tweet is not None:
+            chave = key(tweet)
+            if chave not in agregados:
+                agregados[chave] = SentimentAggregate()
+            agregados[chave].add(media_tweet)
+    return agregados
+
+
+def aggregate_sentiments_by_state(tweets, state_of=find_nearest_state):
+    """Return a dictionary from state names to the SentimentAggregate of the
+    tweets closest to that state's center.
+
+    state_of -- a function from a tweet to a state name
+
+    >>> sf = make_tweet("i love san francisco", None, 38, -122)
+    >>> la = make_tweet("i hate traffic", None, 34, -118)
+    >>> ca = aggregate_sentiments_by_state([sf, la])['CA']
+    >>> ca.count, ca.mean() == average_sentiments({'CA': [sf, la]})['CA']
+    (2, True)
+    """
+    return aggregate_sentiments(tweets, state_of)
+
+
+def aggregate_sentiments_by_state_and_hour(tweets,
+                                           state_of=find_nearest_state):
+    """Return a dictionary from (state, hour) pairs to the SentimentAggregate
+    of the tweets from that state posted during that hour.
+
+    state_of -- a function from a tweet to a state name
+    """
+    return aggregate_sentiments(
+        tweets, lambda tweet: (state_of(tweet), tweet_time(tweet).hour))
+
+
+def average_sentiments_by_state(tweets, state_of=find_nearest_state):
+    """Return the same dictionary as
+    average_sentiments(group_tweets_by_state(tweets)), consuming tweets in a
+    single pass without keeping them in memory.
+
+    tweets -- an iterable of tweets, such as the generator from iter_tweets
+    state_of -- a function from a tweet to a state name
+
+    >>> tweets = load_tweets(make_tweet, 'texas')
+    >>> grouped = average_sentiments(group_tweets_by_state(tweets))
+    >>> average_sentiments_by_state(iter(tweets)) == grouped
+    True
+    """
+    agregados = aggregate_sentiments_by_state(tweets, state_of)
+    return {estado: agregado.mean() for estado, agregado in agregados.items()}
+
+
+def iter_enriched_tweets(term='my job', file_name='all_tweets.txt'):
+    """Yield the tweets in file_name that contain term, as rows of the
+    enriched batches of data.iter_tweet_batches, one batch at a time.
+    """
+    for batch in iter_tweet_batches(term, file_name):
+        yield from batch
+
+
+def state_aggregates_for_term(term, state_of=find_nearest_state,
+                              file_name='all_tweets.txt', tweets=None):
+    """Return a dictionary from state names to the SentimentAggregate of the
+    tweets in file_name that contain term, cached in data.query_cache unless
+    state_of has no stable name (see cache.function_name), as a lambda.  The
+    result is shared between calls, so it must not be modified.
+
+    tweets -- the tweets to aggregate if the result is not cached; by
+              default, iter_enriched_tweets(term, file_name)
+
+    >>> texas = state_aggregates_for_term('texas', file_name='texas.txt')
+    >>> state_aggregates_for_term('texas', file_name='texas.txt') is texas
+    True
+    >>> {s: a.mean() for s, a in texas.items()} == \\
+    ...     average_sentiments_by_state(iter_tweets(make_tweet, 'texas'))
+    True
+    """
+    term = term.lower()
+    if tweets is None:
+        tweets = iter_enriched_tweets(term, file_name)
+    compute = lambda: aggregate_sentiments_by_state(tweets, state_of)
+    nome = function_name(state_of)
+    if nome is None:
+        return compute()
+    return cached_query(('state', nome), term, file_name, compute)
+
+
 # Phase 4: Into the Fourth Dimension
 
 
+@timed
 def group_tweets_by_hour(tweets):
 
     """Return a dictionary that groups tweets by the hour they were posted.
@@ -422,16 +626,41 @@ def group_tweets_by_hour(tweets):
     To get started, read the Python Library documentation for datetime objects:
     http://docs.python.org/py3k/library/datetime.html#datetime.datetime
 
-    tweets -- A list of tweets to be grouped
+    Tweets without a time are left out.
+
+    tweets -- A list of tweets to be grouped, or a TweetBatch; the values are
+              batches as well when tweets is a TweetBatch
+
+    >>> batch = TweetBatch()
+    >>> batch.append('good morning', datetime(2012, 9, 24, 8, 30), 38, -122)
+    >>> batch.append('good night', datetime(2012, 9, 24, 23, 5), 38, -122)
+    >>> batch.append('no time', None, 38, -122)
+    >>> by_hour = group_tweets_by_hour(batch)
+    >>> len(by_hour[8]), len(by_hour[23]), len(by_hour[12])
+    (1, 1, 0)
+    >>> by_list = group_tweets_by_hour(list(batch))
+    >>> [len(by_list[h]) for h in range(24)] == \\
+    ...     [len(by_hour[h]) for h in range(24)]
+    True
     """
+    # para um TweetBatch a hora sai direto da coluna de segundos; os tweets
+    # sem hora (NO_TIME) ficam de fora
+    if isinstance(tweets, TweetBatch):
+        indices_by_hour = {hora: [] for hora in range(24)}
+        for i, segundos in enumerate(tweets.times):
+            if segundos != NO_TIME:
+                indices_by_hour[segundos // 3600 % 24].append(i)
+        return {hora: tweets.subset(indices)
+                for hora, indices in indices_by_hour.items()}
+
     # cria um dicionario com chaves de 0 a 23 e listas como valor
     tweets_by_hour = {hora: [] for hora in range(24)}
 
     # para cada tweet ve a hora e concatena na lista da chave hora
     for tweet in tweets:
         tempo = tweet_time(tweet)
-        horas = tempo.hour
-        tweets_by_hour[horas] += [tweet]
+        if tempo is not None:
+            tweets_by_hour[tempo.hour] += [tweet]
 
     return tweets_by_hour
 
@@ -452,63 +681,163 @@ def print_sentiment(text='Are you virtuous or verminous?'):
 
 def draw_centered_map(center_state='TX', n=10):
     """Draw the n states closest to center_state."""
-    us_centers = {n: find_center(s) for n, s in us_states.items()}
+    us_centers = state_centers()
     center = us_centers[center_state.upper()]
-    dist_from_center = lambda name: geo_distance(center, us_centers[name])
-    for name in sorted(us_states.keys(), key=dist_from_center)[:int(n)]:
+    names = list(us_states.keys())
+    distances = geo_distances(center, [us_centers[name] for name in names])
+    dist_from_center = dict(zip(names, distances.tolist())).get
+    for name in sorted(names, key=dist_from_center)[:int(n)]:
         draw_state(us_states[name])
         draw_name(name, us_centers[name])
     draw_dot(center, 1, 10)  # Mark the center state with a red dot
     wait()
 
 
+@timed
 def draw_state_sentiments(state_sentiments={}):
     """Draw all U.S. states in colors corresponding to their sentiment value.
 
     Unknown state names are ignored; states without values are colored grey.
+    The dots of an earlier map are removed.
 
     state_sentiments -- A dictionary from state strings to sentiment values
     """
+    clear_dots()
     for name, shapes in us_states.items():
         sentiment = state_sentiments.get(name, None)
         draw_state(shapes, sentiment)
-    for name, shapes in us_states.items():
-        center = find_center(shapes)
+    for name, center in state_centers().items():
         if center is not None:
             draw_name(name, center)
 
 
+def draw_term_sentiments(term='my job'):
+    """Draw the states and tweet dots of the sentiment map for term."""
+    # uma so passada pelos lotes enriquecidos: cada tweet e pontuado uma vez,
+    # e dos pontos guarda-se so a posicao e o sentimento, para desenha-los
+    # depois dos estados
+    from array import array
+    pontos = array('d')
+
+    def tweets_guardando_pontos():
+        for tweet in iter_enriched_tweets(term):
+            s = analyze_tweet_sentiment(tweet)
+            if has_sentiment(s):
+                pontos.extend(tweet_location(tweet))
+                pontos.append(sentiment_value(s))
+            yield tweet
+
+    tweets = tweets_guardando_pontos()
+    agregados = state_aggregates_for_term(term, tweets=tweets)
+    # com os agregados no cache de consultas, os tweets sao lidos so agora
+    for tweet in tweets:
+        pass
+    draw_state_sentiments(average_sentiments(agregados))
+    for i in range(0, len(pontos), 3):
+        draw_dot(make_position(pontos[i], pontos[i + 1]), pontos[i + 2])
+
+
 def draw_map_for_term(term='my job'):
     """Draw the sentiment map corresponding to the tweets that contain term.
 
     Some term suggestions:
     New York, Texas, sandwich, my life, justinbieber
     """
-    tweets = load_tweets(make_tweet, term)
-    tweets_by_state = group_tweets_by_state(tweets)
-    state_sentiments = average_sentiments(tweets_by_state)
-    draw_state_sentiments(state_sentiments)
-    for tweet in tweets:
-        s = analyze_tweet_sentiment(tweet)
-        if has_sentiment(s):
-            draw_dot(tweet_location(tweet), sentiment_value(s))
+    draw_term_sentiments(term)
     wait()
 
 
+def hourly_state_sentiments(term='my job', file_name='all_tweets.txt'):
+    """Return a list of 24 dictionaries from state names to the average
+    sentiment of the tweets in file_name that match term, one for each hour
+    of the day.
+    """
+    # um agregado por (estado, hora), calculado em uma so passada pelos lotes
+    # enriquecidos e guardado no cache de consultas
+    term = term.lower()
+    aggregates = cached_query(
+        ('state_hour', function_name(find_nearest_state)), term, file_name,
+        lambda: aggregate_sentiments_by_state_and_hour(
+            iter_enriched_tweets(term, file_name)))
+    por_hora = [{} for hour in range(24)]
+    for (state, hour), aggregate in aggregates.items():
+        por_hora[hour][state] = aggregate.mean()
+    return por_hora
+
+
 def draw_map_by_hour(term='my job', pause=0.5):
     """Draw the sentiment map for tweets that match term, for each hour."""
-    tweets = load_tweets(make_tweet, term)
-    tweets_by_hour = group_tweets_by_hour(tweets)
-
-    for hour in range(24):
-        current_tweets = tweets_by_hour.get(hour, [])
-        tweets_by_state = group_tweets_by_state(current_tweets)
-        state_sentiments = average_sentiments(tweets_by_state)
+    for hour, state_sentiments in enumerate(hourly_state_sentiments(term)):
         draw_state_sentiments(state_sentiments)
         message("{0:02}:00-{0:02}:59".format(hour))
         wait(pause)
 
 
+def save_maps_for_terms(terms='my job', directory='maps'):
+    """Write the sentiment map of each comma-separated term in terms to an
+    SVG file in directory, without opening a window.
+    """
+    from svgcanvas import SVGCanvas
+    canvas = SVGCanvas(width=960, height=500)
+    use_canvas(canvas)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        for term in terms.split(','):
+            term = term.strip()
+            clear()
+            draw_term_sentiments(term)
+            nome = file_name_for_term(term)[:-len('.txt')] + '.svg'
+            canvas.save(os.path.join(directory, nome))
+    finally:
+        use_canvas(None)
+
+
+def save_maps_by_hour(term='my job', directory='maps'):
+    """Write the sentiment map of term for each hour to an SVG file in
+    directory, named after the term and the hour, without opening a window.
+    """
+    from svgcanvas import SVGCanvas
+    canvas = SVGCanvas(width=960, height=500)
+    use_canvas(canvas)
+    os.makedirs(directory, exist_ok=True)
+    prefixo = file_name_for_term(term)[:-len('.txt')]
+    try:
+        for hour, state_sentiments in enumerate(hourly_state_sentiments(term)):
+            draw_state_sentiments(state_sentiments)
+            message("{0:02}:00-{0:02}:59".format(hour))
+            nome = '{0}_{1:02}.svg'.format(prefixo, hour)
+            canvas.save(os.path.join(directory, nome))
+    finally:
+        use_canvas(None)
+
+
+def draw_live_map(term='my job', file_name='all_tweets.txt', cadence=1.0,
+                  address=None):
+    """Draw the sentiment map of the last 24 hours of tweets that match term,
+    redrawing it every cadence seconds as new tweets are appended to
+    file_name (or received from a local socket at address, a (host, port)
+    pair).
+    """
+    from live import SlidingWindow, FileTail, SocketLines, ingest_lines
+    from data import DATA_PATH
+    window = SlidingWindow(analyze_tweet_sentiment, find_nearest_state)
+    if address is None:
+        source = FileTail(DATA_PATH + file_name)
+    else:
+        source = SocketLines(address)
+    while True:
+        # le tudo que chegou desde o ultimo quadro
+        lines = source.read_lines()
+        while lines:
+            ingest_lines(window, lines, term, make_tweet)
+            lines = source.read_lines()
+        draw_state_sentiments(window.snapshot())
+        if window.newest is not None:
+            inicio = window.newest * window.bucket_seconds
+            message(str(from_epoch(inicio))[:13] + ':00')
+        wait(cadence)
+
+
 def run_doctests(names):
     """Run verbose doctests for all functions in space-separated names."""
     g = globals()
@@ -535,9 +864,28 @@ def run(*args):
     parser.add_argument('--draw_centered_map', '-d', action='store_true')
     parser.add_argument('--draw_map_for_term', '-m', action='store_true')
     parser.add_argument('--draw_map_by_hour', '-b', action='store_true')
+    parser.add_argument('--draw_live_map', '-l', action='store_true')
+    parser.add_argument('--save_maps_for_terms', action='store_true')
+    parser.add_argument('--save_maps_by_hour', action='store_true')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the time, calls and memory of each stage')
+    parser.add_argument('--profile_output', metavar='FILE', default=None,
+                        help='With --profile, save cProfile stats to FILE')
     parser.add_argument('text', metavar='T', type=str, nargs='*',
                         help='Text to process')
     args = parser.parse_args()
-    for name, execute in args.__dict__.items():
-        if name != 'text' and execute:
+    options = ('text', 'profile', 'profile_output')
+    commands = [name for name, execute in args.__dict__.items()
+                if name not in options and execute]
+    # as consultas ficam tambem em disco entre execucoes, exceto nos doctests
+    if not args.run_doctests:
+        data.use_query_directory()
+    if args.profile:
+        with profiling(args.profile_output):
+            for name in commands:
+                globals()[name](' '.join(args.text))
+        if data.query_cache is not None:
+            print('Query cache:', data.query_cache.stats())
+    else:
+        for name in commands:
             globals()[name](' '.join(args.text))
@@ -1,11 +1,13 @@
 """The ucb module contains functions specific to 61A at UC Berkeley."""
 
 import code
+from contextlib import contextmanager
 import functools
 import inspect
 import re
 import signal
 import sys
+from time import perf_counter
 
         
 def main(fn):
@@ -99,3 +101,132 @@ def interact(msg=None):
         msg += '    exit() or <Control>-C exits the program'
         
     code.interact(msg, None, namespace)
+
+
+TIMINGS = {}  # Names of timed functions -> [calls, seconds, peak bytes]
+_profiling = False
+_active = set()
+_peaks = []  # [traced bytes at entry, peak traced bytes] of each timed call
+
+def timed(fn):
+    """A decorator that records the number of calls, the total wall time, and
+    the peak memory of a function while profiling is on (see profiling).
+    For example,
+
+    @timed
+    def compute_something(x, y):
+        # function body
+
+    Otherwise, each call only adds one check of a global flag and one extra
+    function call, which is still too much for a function called once per
+    tweet; time whole stages instead.  Time and memory include the
+    function's callees; recursive calls are counted, but only the outermost
+    call is timed.  The peak is the most memory, above the memory in use at
+    the start of a call, that any call has allocated at once.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapped(*args, **kwds):
+        if not _profiling:
+            return fn(*args, **kwds)
+        timing = TIMINGS.setdefault(name, [0, 0.0, 0])
+        timing[0] += 1
+        if name in _active:
+            return fn(*args, **kwds)
+        _active.add(name)
+        import tracemalloc
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            _update_peaks()
+            tracemalloc.reset_peak()
+            _peaks.append([tracemalloc.get_traced_memory()[0]] * 2)
+        start = perf_counter()
+        try:
+            return fn(*args, **kwds)
+        finally:
+            timing[1] += perf_counter() - start
+            if tracing:
+                _update_peaks()
+                before, peak = _peaks.pop()
+                timing[2] = max(timing[2], peak - before)
+            _active.discard(name)
+    return wrapped
+
+def _update_peaks():
+    """Record the peak traced memory in every timed call being measured,
+    before a nested call resets it.
+    """
+    import tracemalloc
+    peak = tracemalloc.get_traced_memory()[1]
+    for entry in _peaks:
+        entry[1] = max(entry[1], peak)
+
+
+@contextmanager
+def profiling(stats_file=None, trace_allocations=True):
+    """Record the timings of the timed functions called within a with
+    statement, and print a summary table at its end.
+
+    stats_file -- if given, also run cProfile and save its statistics there,
+                  to be read with the pstats module
+    trace_allocations -- whether to measure memory with tracemalloc, which
+                         slows down the program
+
+    >>> @timed
+    ... def square(x):
+    ...     return x * x
+    >>> with profiling(trace_allocations=False) as timings:
+    ...     total = sum(square(x) for x in range(1000))  # doctest: +ELLIPSIS
+                        function      calls    seconds ...
+                          square       1000 ...
+    >>> timings['square'][0]
+    1000
+
+    The memory of a call is its peak, so temporary objects count.
+
+    >>> @timed
+    ... def temporary():
+    ...     return len(bytearray(1 << 20))
+    >>> with profiling() as timings:
+    ...     size = temporary()  # doctest: +ELLIPSIS
+                        function      calls    seconds      us/call      peak KB
+                       temporary          1 ...
+    >>> timings['temporary'][2] >= 1 << 20
+    True
+    """
+    global _profiling
+    import cProfile
+    import tracemalloc
+    TIMINGS.clear()
+    if trace_allocations:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if stats_file else None
+    _profiling = True
+    if profiler:
+        profiler.enable()
+    try:
+        yield TIMINGS
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(stats_file)
+        _profiling = False
+        if trace_allocations:
+            tracemalloc.stop()
+        print_timings()
+
+
+def print_timings(timings=None, file=None):
+    """Print a table of timings (by default, those of the last profiling),
+    slowest first.
+    """
+    timings = TIMINGS if timings is None else timings
+    layout = '{0:>28} {1:>10} {2:>10} {3:>12} {4:>12}'
+    print(layout.format('function', 'calls', 'seconds', 'us/call',
+                        'peak KB'), file=file)
+    for name, (calls, seconds, peak) in sorted(
+            timings.items(), key=lambda item: -item[1][1]):
+        print(layout.format(name, calls, '{0:.4f}'.format(seconds),
+                            '{0:.1f}'.format(seconds / calls * 1e6),
+                            '{0:,.1f}'.format(peak / 1024)), file=file)